@@ -1,8 +1,9 @@
-import asyncio
 import os
 
 from aiogram import Bot, Dispatcher
+from aiohttp import web
 from aiogram.client.bot import DefaultBotProperties
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
 from aiogram.enums.parse_mode import ParseMode
 
 from dotenv import find_dotenv, load_dotenv
@@ -10,22 +11,91 @@ from dotenv import find_dotenv, load_dotenv
 load_dotenv(find_dotenv())
 
 from middlewares.db import DataBaseSession
+from middlewares.outbound import OutboundRateLimiter
 
-from database.engine import create_db, drop_db, session_maker
+from database.engine import create_db, dispose_db, drop_db, session_maker
+from database.fsm_storage import SQLStorage
 
+from handlers.menu_coalescer import menu_coalescer
 from handlers.user_private import user_private_router
 from handlers.user_group import user_group_router
 from handlers.admin_private import admin_router
 
+from utils.admins import admin_registry
+from utils.bot_session import TunedAiohttpSession
+from utils.moderation import word_filter
+from utils.runtime import RUNTIME_PROFILE, describe, json_backend, run
+from utils.scheduler import scheduler
+from utils.webhook import create_webhook_app, run_webhook
+
 # from common.bot_cmds_list import private
 
 
 # ALLOWED_UPDATES = ['message', 'edited_message', 'callback_query']
 
-bot = Bot(token=os.getenv('TOKEN'), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-bot.my_admins_list = []
-
-dp = Dispatcher()
+# polling - забирать апдейты самим, webhook - принимать их aiohttp сервером
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL')  # внешний адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv('WEBHOOK_MAX_CONCURRENCY', 100))
+# При нескольких процессах за одним прокси webhook достаточно выставить одному из них
+WEBHOOK_SET_ON_STARTUP = os.getenv('WEBHOOK_SET_ON_STARTUP', '1') == '1'
+
+# HTTP сессия к Bot API (utils/bot_session.py):
+# BOT_API_URL=http://localhost:8081 - свой или фейковый Bot API сервер (по умолчанию api.telegram.org)
+# BOT_API_POOL_SIZE=100              - всего соединений в пуле
+# BOT_API_POOL_PER_HOST=0            - соединений на один хост (0 - без ограничения)
+# BOT_API_DNS_TTL=3600               - сколько секунд кэшировать DNS
+# BOT_API_KEEPALIVE=60               - сколько секунд держать простаивающее соединение
+# BOT_API_TIMEOUT=30                 - таймаут запроса по умолчанию
+# BOT_API_RETRIES=3                  - повторы идемпотентных запросов при сетевых ошибках и 5xx
+# WEBHOOK_STATS_PATH=/stats          - в режиме webhook отдавать статистику соединений по этому пути
+BOT_API_URL = os.getenv('BOT_API_URL')
+BOT_API_METHOD_TIMEOUTS = {
+    # На нажатие кнопки Telegram ждет ответ всего несколько секунд
+    'answerCallbackQuery': 10,
+    # Загрузка файлов может быть долгой
+    'sendPhoto': 60,
+    'editMessageMedia': 60,
+}
+
+# RUNTIME_PROFILE=fast - orjson вместо json и uvloop (utils/runtime.py)
+json_loads, json_dumps = json_backend()
+
+session = TunedAiohttpSession(
+    api=TelegramAPIServer.from_base(BOT_API_URL) if BOT_API_URL else PRODUCTION,
+    limit=int(os.getenv('BOT_API_POOL_SIZE', 100)),
+    limit_per_host=int(os.getenv('BOT_API_POOL_PER_HOST', 0)),
+    ttl_dns_cache=int(os.getenv('BOT_API_DNS_TTL', 3600)),
+    keepalive_timeout=float(os.getenv('BOT_API_KEEPALIVE', 60)),
+    timeout=float(os.getenv('BOT_API_TIMEOUT', 30)),
+    method_timeouts=BOT_API_METHOD_TIMEOUTS,
+    max_retries=int(os.getenv('BOT_API_RETRIES', 3)),
+    json_loads=json_loads,
+    json_dumps=json_dumps,
+)
+bot = Bot(token=os.getenv('TOKEN'), session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# Все исходящие сообщения идут через очередь с лимитами Telegram (middlewares/outbound.py)
+bot.session.middleware(
+    OutboundRateLimiter(
+        global_rate=float(os.getenv('OUTBOUND_GLOBAL_RATE', 30)),
+        chat_rate=float(os.getenv('OUTBOUND_CHAT_RATE', 1)),
+        group_rate=float(os.getenv('OUTBOUND_GROUP_PER_MINUTE', 20)) / 60,
+        max_retries=int(os.getenv('OUTBOUND_MAX_RETRIES', 3)),
+    )
+)
+
+# Состояния FSM храним в БД; FSM_TTL - через сколько секунд бездействия брошенное состояние удаляется,
+# FSM_CACHE_SIZE и FSM_CACHE_TTL - кэш прочитанных состояний в памяти процесса
+dp = Dispatcher(storage=SQLStorage(
+    session_maker,
+    ttl=int(os.getenv('FSM_TTL', 86400)),
+    cache_size=int(os.getenv('FSM_CACHE_SIZE', 10000)),
+    cache_ttl=float(os.getenv('FSM_CACHE_TTL', 3600)),
+))
 
 dp.include_router(user_private_router)
 dp.include_router(user_group_router)
@@ -37,9 +107,28 @@ async def on_startup(bot):
     # await drop_db()
 
     await create_db()
+    menu_coalescer.setup(session_maker)
+    await scheduler.start(bot, session_maker)
+    await word_filter.start(session_maker)
+    await admin_registry.start(bot, session_maker)
+
+    if BOT_MODE == 'webhook' and WEBHOOK_SET_ON_STARTUP:
+        await bot.set_webhook(
+            f'{WEBHOOK_BASE_URL}{WEBHOOK_PATH}',
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=WEBHOOK_MAX_CONCURRENCY,
+            drop_pending_updates=True,
+        )
 
 
 async def on_shutdown(bot):
+    await menu_coalescer.close()
+    await scheduler.stop()
+    await word_filter.stop()
+    await admin_registry.stop()
+    await dispose_db()
+    print('Статистика соединений с Bot API:', session.stats.as_dict())
     print('бот лег')
 
 
@@ -47,11 +136,32 @@ async def main():
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
-    dp.update.middleware(DataBaseSession(session_pool=session_maker))
+    db_session = DataBaseSession(session_pool=session_maker)
+    dp.message.middleware(db_session)
+    dp.edited_message.middleware(db_session)
+    dp.callback_query.middleware(db_session)
 
-    await bot.delete_webhook(drop_pending_updates=True)
     # await bot.delete_my_commands(scope=types.BotCommandScopeAllPrivateChats())
     # await bot.set_my_commands(commands=private, scope=types.BotCommandScopeAllPrivateChats())
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
-
-asyncio.run(main())
\ No newline at end of file
+    if BOT_MODE == 'webhook':
+        if not WEBHOOK_SECRET:
+            raise RuntimeError('Для режима webhook задайте WEBHOOK_SECRET')
+        app = create_webhook_app(
+            dp,
+            bot,
+            path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            max_concurrency=WEBHOOK_MAX_CONCURRENCY,
+        )
+        if os.getenv('WEBHOOK_STATS_PATH'):
+            app.router.add_get(
+                os.getenv('WEBHOOK_STATS_PATH'),
+                lambda request: web.json_response(session.stats.as_dict()),
+            )
+        await run_webhook(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
+print(describe(RUNTIME_PROFILE))
+run(main)
@@ -0,0 +1,162 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from types import MappingProxyType
+
+from utils.paginator import Page
+
+
+############### Кэш баннеров (информационных страниц) ###############
+
+@dataclass(frozen=True)
+class CachedBanner:
+    name: str
+    image: str | None
+    description: str | None
+
+
+class BannerCache:
+    # Баннеры меняются только когда админ загружает новую картинку,
+    # поэтому держим их в памяти и перечитываем из БД раз в ttl секунд
+    # или сразу после сброса (invalidate)
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self._banners: dict[str, CachedBanner] = {}
+        self._loaded_at: float | None = None
+
+    def is_fresh(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        return time.monotonic() - self._loaded_at < self.ttl
+
+    def load(self, banners) -> None:
+        self._banners = {
+            banner.name: CachedBanner(
+                name=banner.name, image=banner.image, description=banner.description
+            )
+            for banner in banners
+        }
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    def get(self, name: str) -> CachedBanner | None:
+        return self._banners.get(name)
+
+    def all(self) -> list[CachedBanner]:
+        return list(self._banners.values())
+
+
+banner_cache = BannerCache(ttl=float(os.getenv('BANNER_CACHE_TTL', 300)))
+
+
+############### Снимок каталога (категории и товары) ###############
+
+@dataclass(frozen=True)
+class CachedCategory:
+    id: int
+    name: str
+
+
+@dataclass(frozen=True)
+class CachedProduct:
+    id: int
+    name: str
+    description: str
+    price: Decimal
+    image: str
+    category_id: int
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: int
+    # Версия каталога в БД (таблица catalog_version), с которой собран снимок
+    db_version: int | None
+    categories: tuple[CachedCategory, ...] = ()
+    products: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+
+    def get_products(self, category_id: int) -> tuple[CachedProduct, ...]:
+        return self.products.get(int(category_id), ())
+
+    def products_page(self, category_id: int, page: int, per_page: int = 1) -> Page:
+        products = self.get_products(category_id)
+        page = min(max(page, 1), max(math.ceil(len(products) / per_page), 1))
+        start = (page - 1) * per_page
+        return Page(products[start:start + per_page], len(products), page, per_page)
+
+
+class CatalogCache:
+    # Каталог меняется только через админку, поэтому меню читает его из памяти.
+    # Снимок неизменяемый: при пересборке создается новый объект и подменяется
+    # одной операцией присваивания, так что читатели никогда не видят его наполовину.
+    # Правку мог сделать другой процесс бота, поэтому не чаще раза в check_interval
+    # секунд версия снимка сверяется с версией каталога в БД
+    def __init__(self, check_interval: float = 10):
+        self.check_interval = check_interval
+        self.snapshot: CatalogSnapshot | None = None
+        self.lock = asyncio.Lock()
+        self._version = 0
+        self._checked_at = time.monotonic()
+
+    def needs_check(self) -> bool:
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = time.monotonic()
+        return True
+
+    def load(self, categories, products, db_version: int | None) -> CatalogSnapshot:
+        grouped: dict[int, list[CachedProduct]] = {}
+        for product in products:
+            grouped.setdefault(product.category_id, []).append(
+                CachedProduct(
+                    id=product.id,
+                    name=product.name,
+                    description=product.description,
+                    price=product.price,
+                    image=product.image,
+                    category_id=product.category_id,
+                )
+            )
+        self._version += 1
+        self._checked_at = time.monotonic()
+        self.snapshot = CatalogSnapshot(
+            version=self._version,
+            db_version=db_version,
+            categories=tuple(CachedCategory(id=c.id, name=c.name) for c in categories),
+            products=MappingProxyType({k: tuple(v) for k, v in grouped.items()}),
+        )
+        return self.snapshot
+
+
+catalog_cache = CatalogCache(check_interval=float(os.getenv('CATALOG_CHECK_INTERVAL', 10)))
+
+
+############### Уже зарегистрированные пользователи ###############
+
+class KnownUsers:
+    # Ограниченный LRU из telegram id пользователей, которые точно есть в таблице user.
+    # Самые давние вытесняются, когда набралось больше maxsize
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._users: OrderedDict[int, None] = OrderedDict()
+
+    def __contains__(self, user_id: int) -> bool:
+        if user_id in self._users:
+            self._users.move_to_end(user_id)
+            return True
+        return False
+
+    def add(self, user_id: int) -> None:
+        self._users[user_id] = None
+        self._users.move_to_end(user_id)
+        if len(self._users) > self.maxsize:
+            self._users.popitem(last=False)
+
+
+known_users = KnownUsers(maxsize=int(os.getenv('KNOWN_USERS_CACHE_SIZE', 10000)))
@@ -0,0 +1,212 @@
+# FSM хранилище в БД бота: состояния Ordering/AddProduct переживают перезапуск
+# и видны всем процессам бота
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import DEFAULT_DESTINY, BaseStorage, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.models import FsmState
+from database.orm_query import dialect_insert, utcnow
+
+
+logger = logging.getLogger(__name__)
+
+def storage_row_key(key: StorageKey) -> tuple[int, int, int, str]:
+    extra = ''
+    if key.thread_id or key.business_connection_id or key.destiny != DEFAULT_DESTINY:
+        extra = f'{key.business_connection_id or ""}:{key.thread_id or ""}:{key.destiny}'
+    return key.bot_id, key.chat_id, key.user_id, extra
+
+
+class SQLStorage(BaseStorage):
+    # Запись отложенная: set_state и следующий за ним update_data в одном хендлере
+    # складываются в память и через flush_delay секунд уходят в БД одним upsert на ключ.
+    # Изменение лежит в памяти, пока его коммит не прошел, поэтому чтение (сначала память,
+    # потом БД) всегда видит последнее состояние. Сбросы в БД идут строго по одному,
+    # а неудачный сброс повторяется через retry_delay секунд.
+    # Прочитанные из БД и записанные значения (в том числе "состояния нет") держатся
+    # в ограниченном кэше на cache_ttl секунд, так что FSMContextMiddleware не ходит
+    # в БД на каждый апдейт. Кэш свой у каждого процесса: если бот запущен в несколько
+    # процессов, cache_ttl нужно держать маленьким (или 0).
+    # Брошенные состояния (нет изменений дольше ttl секунд) удаляются
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        ttl: float = 86400,
+        flush_delay: float = 0.05,
+        retry_delay: float = 1,
+        evict_interval: float = 600,
+        cache_size: int = 10000,
+        cache_ttl: float = 3600,
+    ) -> None:
+        self.session_pool = session_pool
+        self.ttl = ttl
+        self.flush_delay = flush_delay
+        self.retry_delay = retry_delay
+        self.evict_interval = evict_interval
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._pending: dict[tuple, dict[str, Any]] = {}
+        # Номер последнего изменения ключа: запись убирается из памяти,
+        # только если после сброса ее не успели поменять
+        self._versions: dict[tuple, int] = {}
+        self._lock = asyncio.Lock()
+        self._closing = asyncio.Event()
+        self._flush_task: asyncio.Task | None = None
+        # Ограниченный LRU: ключ -> (известные поля state/data, когда записаны)
+        self._cache: OrderedDict[tuple, tuple[dict[str, Any], float]] = OrderedDict()
+        self._evicted_at = time.monotonic()
+
+    def _write(self, key: StorageKey, **values: Any) -> None:
+        row_key = storage_row_key(key)
+        self._pending.setdefault(row_key, {}).update(values)
+        self._versions[row_key] = self._versions.get(row_key, 0) + 1
+        self._cache_put(row_key, {**(self._cached(row_key) or {}), **values})
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        delay = self.flush_delay
+        while self._pending:
+            try:
+                await asyncio.wait_for(self._closing.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+                delay = self.flush_delay
+            except Exception:
+                logger.exception("Не удалось сохранить состояния FSM, повтор через %s с", self.retry_delay)
+                if self._closing.is_set():
+                    break
+                delay = self.retry_delay
+        self._flush_task = None
+
+    async def flush(self) -> None:
+        async with self._lock:
+            batch = {
+                row_key: (dict(values), self._versions[row_key])
+                for row_key, values in self._pending.items()
+            }
+            if not batch:
+                return
+            async with self.session_pool() as session:
+                for (bot_id, chat_id, user_id, extra), (values, _) in batch.items():
+                    await session.execute(self._upsert(session, bot_id, chat_id, user_id, extra, values))
+                    # Пустые записи (после state.clear()) не храним
+                    if values.get('state', '') is None or values.get('data') == {}:
+                        await session.execute(
+                            delete(FsmState).where(
+                                FsmState.bot_id == bot_id,
+                                FsmState.chat_id == chat_id,
+                                FsmState.user_id == user_id,
+                                FsmState.extra == extra,
+                                FsmState.state.is_(None),
+                                FsmState.data == '{}',
+                            )
+                        )
+                if time.monotonic() - self._evicted_at > self.evict_interval:
+                    await self._evict(session)
+                await session.commit()
+
+            for row_key, (_, version) in batch.items():
+                if self._versions.get(row_key) == version:
+                    del self._pending[row_key]
+                    del self._versions[row_key]
+
+    @staticmethod
+    def _upsert(session, bot_id, chat_id, user_id, extra, values: dict):
+        if 'data' in values:
+            values = {**values, 'data': json.dumps(values['data'], ensure_ascii=False, default=str)}
+        # Время изменения считаем в Python, как и границу в _evict: время сервера БД
+        # может быть в другом часовом поясе
+        updated = utcnow()
+        query = dialect_insert(session, FsmState).values(
+            bot_id=bot_id, chat_id=chat_id, user_id=user_id, extra=extra, updated=updated, **values
+        )
+        return query.on_conflict_do_update(
+            index_elements=[FsmState.bot_id, FsmState.chat_id, FsmState.user_id, FsmState.extra],
+            set_={**values, 'updated': updated},
+        )
+
+    async def _evict(self, session) -> None:
+        self._evicted_at = time.monotonic()
+        expired = utcnow() - timedelta(seconds=self.ttl)
+        await session.execute(delete(FsmState).where(FsmState.updated < expired))
+
+    async def _load(self, key: StorageKey) -> Optional[FsmState]:
+        bot_id, chat_id, user_id, extra = storage_row_key(key)
+        query = select(FsmState.state, FsmState.data).where(
+            FsmState.bot_id == bot_id,
+            FsmState.chat_id == chat_id,
+            FsmState.user_id == user_id,
+            FsmState.extra == extra,
+        )
+        async with self.session_pool() as session:
+            return (await session.execute(query)).first()
+
+    def _cached(self, row_key: tuple) -> Optional[dict[str, Any]]:
+        entry = self._cache.get(row_key)
+        if entry is None:
+            return None
+        fields, cached_at = entry
+        if time.monotonic() - cached_at >= self.cache_ttl:
+            del self._cache[row_key]
+            return None
+        self._cache.move_to_end(row_key)
+        return fields
+
+    def _cache_put(self, row_key: tuple, fields: dict[str, Any]) -> None:
+        self._cache[row_key] = (fields, time.monotonic())
+        self._cache.move_to_end(row_key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _read(self, key: StorageKey, field: str) -> Any:
+        # Сначала несохраненные изменения, потом кэш, и только потом БД
+        row_key = storage_row_key(key)
+        pending = self._pending.get(row_key, {})
+        if field in pending:
+            return pending[field]
+        fields = self._cached(row_key)
+        if fields is not None and field in fields:
+            return fields[field]
+
+        row = await self._load(key)
+        loaded = {'state': row.state, 'data': json.loads(row.data)} if row else {'state': None, 'data': {}}
+        # Записанное, пока шел запрос, новее прочитанного из БД
+        fields = {**loaded, **(self._cached(row_key) or {})}
+        self._cache_put(row_key, fields)
+        return fields[field]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._write(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._read(key, 'state')
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        self._write(key, data=data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._read(key, 'data')).copy()
+
+    async def close(self) -> None:
+        # Не ждем flush_delay, но дожидаемся уже идущего сброса
+        self._closing.set()
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
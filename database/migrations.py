@@ -0,0 +1,80 @@
+from sqlalchemy import Column, Integer, Table, delete, func, inspect, insert, select, text, update
+
+from database.models import Base, CatalogVersion, Cart, Messages, Order_items, Orders, Product, RestrictedWordVersion
+
+
+# Номер последней примененной миграции. create_all создает только недостающие таблицы
+# и не меняет существующие, поэтому все изменения схемы для уже работающих баз
+# дописываются сюда функциями в конец списка MIGRATIONS
+schema_version = Table(
+    'schema_version',
+    Base.metadata,
+    Column('version', Integer, nullable=False),
+)
+
+
+def cart_unique_index(conn):
+    # Сливаем дубли строк корзины и создаем уникальный индекс (user_id, product_id)
+    cart = Cart.__table__
+    if 'ix_cart_user_product' in {index['name'] for index in inspect(conn).get_indexes('cart')}:
+        return
+
+    other = cart.alias()
+    keep = select(func.min(cart.c.id)).group_by(cart.c.user_id, cart.c.product_id)
+    total = (
+        select(func.sum(other.c.quantity))
+        .where(other.c.user_id == cart.c.user_id, other.c.product_id == cart.c.product_id)
+        .scalar_subquery()
+    )
+    conn.execute(update(cart).where(cart.c.id.in_(keep)).values(quantity=total))
+    conn.execute(delete(cart).where(cart.c.id.not_in(keep)))
+    for index in cart.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def hot_path_indexes(conn):
+    # Индексы под фильтры меню, корзины и заказов
+    for model in (Product, Orders, Order_items, Messages):
+        for index in model.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def scheduled_job_attempts(conn):
+    # Счетчик неудачных запусков отложенной задачи
+    if 'attempts' in {column['name'] for column in inspect(conn).get_columns('scheduled_job')}:
+        return
+    conn.execute(text('ALTER TABLE scheduled_job ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0'))
+
+
+def catalog_version_row(conn):
+    # Единственная строка с версией каталога
+    table = CatalogVersion.__table__
+    if conn.execute(select(table.c.id)).first() is None:
+        conn.execute(insert(table).values(id=1, version=0))
+
+
+def restricted_word_version_row(conn):
+    # Единственная строка с версией списка запрещенных слов
+    table = RestrictedWordVersion.__table__
+    if conn.execute(select(table.c.id)).first() is None:
+        conn.execute(insert(table).values(id=1, version=0))
+
+
+MIGRATIONS = [
+    cart_unique_index,
+    hot_path_indexes,
+    scheduled_job_attempts,
+    catalog_version_row,
+    restricted_word_version_row,
+]
+
+
+def run_migrations(conn):
+    current = conn.execute(select(schema_version.c.version)).scalar()
+    if current is None:
+        current = 0
+        conn.execute(insert(schema_version).values(version=current))
+
+    for version, migration in enumerate(MIGRATIONS[current:], start=current + 1):
+        migration(conn)
+        conn.execute(update(schema_version).values(version=version))
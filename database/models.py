@@ -1,4 +1,6 @@
-from sqlalchemy import DateTime, ForeignKey, Numeric, String, Text, BigInteger, func
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, Numeric, String, Text, BigInteger, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -31,7 +33,7 @@ class Product(Base):
     description: Mapped[str] = mapped_column(Text)
     price: Mapped[float] = mapped_column(Numeric(5,2), nullable=False)
     image: Mapped[str] = mapped_column(String(150))
-    category_id: Mapped[int] = mapped_column(ForeignKey('category.id', ondelete='CASCADE'), nullable=False)
+    category_id: Mapped[int] = mapped_column(ForeignKey('category.id', ondelete='CASCADE'), nullable=False, index=True)
 
     category: Mapped['Category'] = relationship(backref='product')
 
@@ -48,6 +50,10 @@ class User(Base):
 
 class Cart(Base):
     __tablename__ = 'cart'
+    # Один товар у пользователя - одна строка, на этом держится upsert в orm_add_to_cart
+    __table_args__ = (
+        Index('ix_cart_user_product', 'user_id', 'product_id', unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('user.user_id', ondelete='CASCADE'), nullable=False)
@@ -62,7 +68,7 @@ class Messages(Base):
     __tablename__ = 'messages'
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey('user.user_id', ondelete='CASCADE'), nullable=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey('user.user_id', ondelete='CASCADE'), nullable=False, index=True)
     chat_id: Mapped[int]
     message_id: Mapped[int]
 
@@ -73,10 +79,10 @@ class Orders(Base):
     __tablename__ = 'orders'
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey('user.user_id', ondelete='CASCADE'), nullable=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey('user.user_id', ondelete='CASCADE'), nullable=False, index=True)
     # phone_number = mapped_column(String(12), nullable=False)
     delivery_address: Mapped[str] = mapped_column(Text) #записывается адресс / в ресторане / самовывоз
-    status: Mapped[str] = mapped_column(String(150), nullable=False, default='Не готово') 
+    status: Mapped[str] = mapped_column(String(150), nullable=False, default='Не готово', index=True)
 
 
     user: Mapped['User'] = relationship(backref='orders')
@@ -86,7 +92,7 @@ class Order_items(Base):
     __tablename__ = 'order_items'
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    order_id: Mapped[int] = mapped_column(ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
+    order_id: Mapped[int] = mapped_column(ForeignKey('orders.id', ondelete='CASCADE'), nullable=False, index=True)
     product_id: Mapped[int] = mapped_column(ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
     quantity: Mapped[int]
 
@@ -94,4 +100,60 @@ class Order_items(Base):
     product: Mapped['Product'] = relationship(backref='order_items')
 
 
-    
\ No newline at end of file
+class CatalogVersion(Base):
+    __tablename__ = 'catalog_version'
+
+    # Одна строка: номер растет в каждой транзакции, которая меняет товары или категории.
+    # По нему процессы бота замечают, что их снимок каталога устарел
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ScheduledJob(Base):
+    __tablename__ = 'scheduled_job'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+    run_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True) # UTC
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    message_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    # Сколько раз задача уже падала (для повтора с нарастающей задержкой)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+
+
+class FsmState(Base):
+    __tablename__ = 'fsm_state'
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # thread_id / business_connection_id / destiny из StorageKey, обычно пустая строка
+    extra: Mapped[str] = mapped_column(String(150), primary_key=True, default='')
+    state: Mapped[str] = mapped_column(String(150), nullable=True)
+    data: Mapped[str] = mapped_column(Text, nullable=False, default='{}')
+
+
+class RestrictedWord(Base):
+    __tablename__ = 'restricted_word'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    # Слово целиком; с '*' на конце - основа, под нее попадают все окончания (кабан* -> кабанчик)
+    word: Mapped[str] = mapped_column(String(150), nullable=False, unique=True)
+
+
+class RestrictedWordVersion(Base):
+    __tablename__ = 'restricted_word_version'
+
+    # Одна строка: номер растет при каждой правке списка запрещенных слов.
+    # По нему процессы бота замечают, что матчер пора пересобрать
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ChatAdmin(Base):
+    __tablename__ = 'chat_admin'
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, index=True)
+
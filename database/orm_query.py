@@ -1,9 +1,73 @@
+import inspect
 import math
-from sqlalchemy import select, update, delete
+from datetime import datetime, timezone
+from sqlalchemy import func, insert, literal, select, update, delete
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 
-from database.models import Banner, Cart, Category, Order_items, Orders, Product, User, Messages
+from database.cache import banner_cache, catalog_cache, known_users
+from database.models import Banner, CatalogVersion, Cart, Category, Order_items, Orders, Product, User, Messages, ScheduledJob, RestrictedWord, RestrictedWordVersion, ChatAdmin
+from utils.paginator import Page
+
+
+############### Единица работы (unit of work) ###############
+# orm_* функции только делают flush. Коммит один на весь апдейт - его делает
+# middleware DataBaseSession (или вызывающий код через orm_commit), а действия,
+# которые должны случиться только после успешного коммита (сброс кэшей),
+# откладываются через on_commit
+
+def on_commit(session: AsyncSession, callback):
+    session.info.setdefault("on_commit", []).append(callback)
+
+
+async def orm_commit(session: AsyncSession):
+    await session.commit()
+    for callback in session.info.pop("on_commit", []):
+        result = callback()
+        if inspect.isawaitable(result):
+            await result
+
+
+async def orm_rollback(session: AsyncSession):
+    session.info.pop("on_commit", None)
+    await session.rollback()
+
+
+def utcnow() -> datetime:
+    # Время для колонок DateTime без часового пояса: всегда UTC, считается в Python
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def dialect_insert(session: AsyncSession, model):
+    # INSERT ... ON CONFLICT есть и в SQLite, и в PostgreSQL, но строится своим диалектом
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+############### Постраничная выборка ###############
+
+async def orm_paginate(session: AsyncSession, query, page: int, per_page: int = 1):
+    # Выбираем только нужную страницу и общее число строк.
+    # count(*) over () считается до LIMIT/OFFSET, так что хватает одного запроса
+    page = max(page, 1)
+    paged = (
+        query.add_columns(func.count().over())
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    )
+    rows = (await session.execute(paged)).unique().all()
+    if rows:
+        return Page([row[0] for row in rows], rows[0][-1], page, per_page)
+
+    # Страница вышла за пределы (например, запись удалили) - показываем последнюю
+    count_query = query.with_only_columns(func.count(), maintain_column_froms=True).order_by(None)
+    total = await session.scalar(count_query)
+    last_page = math.ceil(total / per_page)
+    if total and page > last_page:
+        return await orm_paginate(session, query, last_page, per_page)
+    return Page([], total, page, per_page)
 
 
 ############### Работа с сообщениями ###############
@@ -20,7 +84,7 @@ async def orm_add_message(
         session.add(
             Messages(user_id=user_id, chat_id=chat_id, message_id=message_id)
         )
-        await session.commit()
+        await session.flush()
 
 async def orm_get_message(session: AsyncSession, user_id: int):
     query = select(Messages).where(Messages.user_id == user_id)
@@ -30,7 +94,6 @@ async def orm_get_message(session: AsyncSession, user_id: int):
 async def orm_delete_message(session: AsyncSession, user_id: int):
     query = delete(Messages).where(Messages.user_id == user_id)
     await session.execute(query)
-    await session.commit()
 
 ############### Работа с баннерами (информационными страницами) ###############
 
@@ -42,25 +105,33 @@ async def orm_add_banner_description(session: AsyncSession, data: dict):
     if result.first():
         return
     session.add_all([Banner(name=name, description=description) for name, description in data.items()]) 
-    await session.commit()
+    await session.flush()
+    on_commit(session, banner_cache.invalidate)
 
 
 async def orm_change_banner_image(session: AsyncSession, name: str, image: str):
     query = update(Banner).where(Banner.name == name).values(image=image)
     await session.execute(query)
-    await session.commit()
+    on_commit(session, banner_cache.invalidate)
 
 
-async def orm_get_banner(session: AsyncSession, menu_name: str):
-    query = select(Banner).where(Banner.name == menu_name)
+async def orm_load_banners(session: AsyncSession):
+    # Перечитываем все баннеры одним запросом и кладем их в кэш
+    query = select(Banner)
     result = await session.execute(query)
-    return result.scalar()
+    banner_cache.load(result.scalars().all())
+
+
+async def orm_get_banner(session: AsyncSession, menu_name: str):
+    if not banner_cache.is_fresh():
+        await orm_load_banners(session)
+    return banner_cache.get(menu_name)
 
 
 async def orm_get_info_pages(session: AsyncSession):
-    query = select(Banner)
-    result = await session.execute(query)
-    return result.scalars().all()
+    if not banner_cache.is_fresh():
+        await orm_load_banners(session)
+    return banner_cache.all()
 
 
 ############################ Категории ######################################
@@ -76,7 +147,51 @@ async def orm_create_categories(session: AsyncSession, categories: list):
     if result.first():
         return
     session.add_all([Category(name=name) for name in categories]) 
-    await session.commit()
+    await session.flush()
+    await orm_rebuild_catalog_on_commit(session)
+
+
+async def orm_rebuild_catalog(session: AsyncSession):
+    # Собираем новый снимок каталога и атомарно подменяем старый
+    async with catalog_cache.lock:
+        # Версию читаем первой: правка, закоммиченная во время сборки, даст новую версию
+        # при следующей сверке, и снимок просто соберется еще раз
+        db_version = await orm_get_catalog_version(session)
+        # populate_existing - чтобы не взять из identity map объекты с питоновскими значениями
+        categories = await session.execute(
+            select(Category).order_by(Category.id).execution_options(populate_existing=True)
+        )
+        products = await session.execute(
+            select(Product).order_by(Product.id).execution_options(populate_existing=True)
+        )
+        return catalog_cache.load(categories.scalars().all(), products.scalars().all(), db_version)
+
+
+async def orm_get_catalog_version(session: AsyncSession):
+    return await session.scalar(select(CatalogVersion.version))
+
+
+async def orm_rebuild_catalog_on_commit(session: AsyncSession):
+    # Снимок пересобираем один раз за коммит, сколько бы товаров ни поменялось.
+    # Проверяем, что отложенная пересборка еще в очереди: после отката
+    # ее там уже нет, и ее нужно поставить заново.
+    # В той же транзакции растет версия каталога, чтобы остальные процессы бота
+    # пересобрали свои снимки
+    rebuild = session.info.get("catalog_rebuild")
+    if rebuild is None:
+        rebuild = session.info["catalog_rebuild"] = lambda: orm_rebuild_catalog(session)
+    if rebuild not in session.info.get("on_commit", []):
+        await session.execute(update(CatalogVersion).values(version=CatalogVersion.version + 1))
+        on_commit(session, rebuild)
+
+
+async def orm_get_catalog(session: AsyncSession):
+    snapshot = catalog_cache.snapshot
+    if snapshot is None:
+        return await orm_rebuild_catalog(session)
+    if catalog_cache.needs_check() and await orm_get_catalog_version(session) != snapshot.db_version:
+        return await orm_rebuild_catalog(session)
+    return snapshot
 
 ############ Админка: добавить/изменить/удалить товар ########################
 
@@ -89,13 +204,15 @@ async def orm_add_product(session: AsyncSession, data: dict):
         category_id=int(data["category"]),
     )
     session.add(obj)
-    await session.commit()
+    await session.flush()
+    await orm_rebuild_catalog_on_commit(session)
 
 
-async def orm_get_products(session: AsyncSession, category_id):
-    query = select(Product).where(Product.category_id == int(category_id))
-    result = await session.execute(query)
-    return result.scalars().all()
+async def orm_get_products_page(session: AsyncSession, category_id, page: int, per_page: int = 1):
+    # Отдаем только запрошенную страницу и общее число товаров в категории.
+    # Страница режется из снимка каталога в памяти без похода в БД
+    catalog = await orm_get_catalog(session)
+    return catalog.products_page(category_id, page, per_page)
 
 
 async def orm_get_product(session: AsyncSession, product_id: int):
@@ -117,13 +234,13 @@ async def orm_update_product(session: AsyncSession, product_id: int, data):
         )
     )
     await session.execute(query)
-    await session.commit()
+    await orm_rebuild_catalog_on_commit(session)
 
 
 async def orm_delete_product(session: AsyncSession, product_id: int):
     query = delete(Product).where(Product.id == product_id)
     await session.execute(query)
-    await session.commit()
+    await orm_rebuild_catalog_on_commit(session)
 
 
 ##################### Добавляем юзера в БД #####################################
@@ -134,13 +251,17 @@ async def orm_add_user(
     first_name: str | None = None,
     phone: str | None = None,
 ):
-    query = select(User).where(User.user_id == user_id)
-    result = await session.execute(query)
-    if result.first() is None:
-        session.add(
-            User(user_id=user_id, first_name=first_name, phone=phone)
-        )
-        await session.commit()
+    # Почти всегда пользователь уже есть, поэтому сначала смотрим в кэш,
+    # а при промахе вставляем без предварительного SELECT
+    if user_id in known_users:
+        return
+    query = (
+        dialect_insert(session, User)
+        .values(user_id=user_id, first_name=first_name, phone=phone)
+        .on_conflict_do_nothing(index_elements=[User.user_id])
+    )
+    await session.execute(query)
+    on_commit(session, lambda: known_users.add(user_id))
 
 async def orm_update_user(
     session: AsyncSession,
@@ -158,78 +279,129 @@ async def orm_update_user(
         )
     )
     await session.execute(query)
-    await session.commit()
 
 
 
 ######################## Работа с корзинами #######################################
 
-async def orm_add_to_cart(session: AsyncSession, user_id: int, product_id: int):
-    query = select(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id).options(joinedload(Cart.product))
-    cart = await session.execute(query)
-    cart = cart.scalar()
-    if cart:
-        cart.quantity += 1
-        await session.commit()
-        return cart
+async def orm_change_cart_quantity(session: AsyncSession, user_id: int, product_id: int, delta: int):
+    # Атомарно меняем количество товара в корзине одним запросом и возвращаем новое количество.
+    # 0 - строка удалена, None - такого товара в корзине не было
+    if delta > 0:
+        query = (
+            dialect_insert(session, Cart)
+            .values(user_id=user_id, product_id=product_id, quantity=delta)
+            .on_conflict_do_update(
+                index_elements=[Cart.user_id, Cart.product_id],
+                set_={"quantity": Cart.quantity + delta, "updated": func.now()},
+            )
+            .returning(Cart.quantity)
+        )
     else:
-        session.add(Cart(user_id=user_id, product_id=product_id, quantity=1))
-        await session.commit()
+        query = (
+            update(Cart)
+            .where(Cart.user_id == user_id, Cart.product_id == product_id)
+            .values(quantity=Cart.quantity + delta)
+            .returning(Cart.quantity)
+        )
+    quantity = (await session.execute(query)).scalar()
 
+    if quantity is not None and quantity <= 0:
+        query = delete(Cart).where(
+            Cart.user_id == user_id, Cart.product_id == product_id, Cart.quantity <= 0
+        )
+        await session.execute(query)
+        quantity = 0
+    return quantity
 
 
-async def orm_get_user_carts(session: AsyncSession, user_id):
-    query = select(Cart).filter(Cart.user_id == user_id).options(joinedload(Cart.product))
-    result = await session.execute(query)
-    return result.scalars().all()
+async def orm_add_to_cart(session: AsyncSession, user_id: int, product_id: int):
+    return await orm_change_cart_quantity(session, user_id, product_id, 1)
+
+
+def orm_get_cart_summary_query(user_id: int):
+    # Итоги корзины считает сама БД оконными функциями по всем строкам пользователя,
+    # а наружу уходит только строка для текущей страницы (LIMIT задает пагинатор).
+    # Строки результата: (Cart, общая стоимость, число позиций, номер позиции)
+    summary = (
+        select(
+            Cart.id,
+            func.sum(Cart.quantity * Product.price).over().label("total_price"),
+            func.count().over().label("items_count"),
+            func.row_number().over(order_by=Cart.id).label("position"),
+        )
+        .join(Product, Cart.product_id == Product.id)
+        .where(Cart.user_id == user_id)
+        .subquery()
+    )
+    return (
+        select(Cart, summary.c.total_price, summary.c.items_count, summary.c.position)
+        .join(summary, summary.c.id == Cart.id)
+        .options(joinedload(Cart.product))
+        .execution_options(populate_existing=True)
+    )
 
 
 async def orm_delete_from_cart(session: AsyncSession, user_id: int, product_id: int):
     query = delete(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id)
     await session.execute(query)
-    await session.commit()
 
 
 async def orm_reduce_product_in_cart(session: AsyncSession, user_id: int, product_id: int):
-    query = select(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id)
-    cart = await session.execute(query)
-    cart = cart.scalar()
-
-    if not cart:
-        return
-    if cart.quantity > 1:
-        cart.quantity -= 1
-        await session.commit()
-        return True
-    else:
-        await orm_delete_from_cart(session, user_id, product_id)
-        await session.commit()
-        return False
+    return await orm_change_cart_quantity(session, user_id, product_id, -1)
 
 
 ######################## Работа с заказами #######################################
 
 
-async def orm_add_order(session: AsyncSession, user_id: int, data: dict):
-    obj = Orders(
-        user_id=user_id,
-        # phone=data["phone"],
-        delivery_address=data["delivery_address"],
+async def orm_checkout(session: AsyncSession, user_id: int, data: dict):
+    # Оформление заказа одной транзакцией: обновляем пользователя, создаем заказ,
+    # одним INSERT ... SELECT переносим корзину в позиции заказа и очищаем корзину.
+    # Если что-то упадет посередине, откатится все целиком
+    await session.execute(
+        update(User)
+        .where(User.user_id == user_id)
+        .values(first_name=data["first_name"], phone=data["phone"])
     )
-    session.add(obj)
-    await session.commit()
-    return obj.id
+    order = Orders(user_id=user_id, delivery_address=data["delivery_address"])
+    session.add(order)
+    await session.flush()
+
+    cart_rows = select(literal(order.id), Cart.product_id, Cart.quantity).where(Cart.user_id == user_id)
+    await session.execute(
+        insert(Order_items).from_select(
+            [Order_items.order_id, Order_items.product_id, Order_items.quantity], cart_rows
+        )
+    )
+    await session.execute(delete(Cart).where(Cart.user_id == user_id))
+    return order.id
 
 
-async def orm_get_user_orders(session: AsyncSession): # Для просмотра заказов админом
-    query = select(Orders).where(Orders.status == "Не готово").options(joinedload(Orders.user))
-    result = await session.execute(query)
-    return result.scalars().all()
+async def orm_get_pending_orders_page(session: AsyncSession, page: int, per_page: int = 5): # Очередь заказов для админа
+    # Позиции всех заказов страницы подгружаются одним дополнительным запросом (selectinload)
+    query = (
+        select(Orders)
+        .where(Orders.status == "Не готово")
+        .order_by(Orders.id)
+        .options(
+            joinedload(Orders.user),
+            selectinload(Orders.order_items).joinedload(Order_items.product),
+        )
+    )
+    return await orm_paginate(session, query, page, per_page)
 
-async def orm_get_user_orders2(session: AsyncSession, user_id: int): # Для просмотра заказов пользователем
-    query = select(Orders).where(Orders.user_id == user_id).options(joinedload(Orders.user))
-    result = await session.execute(query)
-    return result.scalars().all()
+async def orm_get_user_orders_page(session: AsyncSession, user_id: int, page: int, per_page: int = 1):
+    # Одна страница заказов пользователя вместе с получателем, позициями и товарами
+    query = (
+        select(Orders)
+        .where(Orders.user_id == user_id)
+        .order_by(Orders.id)
+        .options(
+            joinedload(Orders.user),
+            joinedload(Orders.order_items).joinedload(Order_items.product),
+        )
+    )
+    return await orm_paginate(session, query, page, per_page)
 
 
 async def orm_update_order(session: AsyncSession, order_id: int):
@@ -240,19 +412,120 @@ async def orm_update_order(session: AsyncSession, order_id: int):
         )
     )
     await session.execute(query)
-    await session.commit()
 
 
-async def orm_add_order_items(session: AsyncSession, order_id: int, product_id: int, quantity: int):
-    session.add(Order_items(order_id=order_id, product_id=product_id, quantity=quantity))
-    await session.commit()
+######################## Отложенные задачи #######################################
+
+async def orm_add_job(
+    session: AsyncSession,
+    kind: str,
+    run_at,
+    chat_id: int | None = None,
+    message_id: int | None = None,
+    user_id: int | None = None,
+    attempts: int = 0,
+):
+    session.add(
+        ScheduledJob(
+            kind=kind,
+            run_at=run_at,
+            chat_id=chat_id,
+            message_id=message_id,
+            user_id=user_id,
+            attempts=attempts,
+        )
+    )
+    await session.flush()
 
 
-async def orm_get_order_items(session: AsyncSession, order_id: int):
-    query = select(Order_items).filter(Order_items.order_id == order_id).options(joinedload(Order_items.product))
+async def orm_take_due_jobs(session: AsyncSession, now, limit: int):
+    # Забираем пачку созревших задач одним DELETE ... RETURNING,
+    # так что одну задачу не выполнят два процесса бота
+    due = select(ScheduledJob.id).where(ScheduledJob.run_at <= now).order_by(ScheduledJob.run_at).limit(limit)
+    query = delete(ScheduledJob).where(ScheduledJob.id.in_(due)).returning(ScheduledJob)
+    result = await session.execute(query)
+    jobs = result.scalars().all()
+    # Строк уже нет, поэтому объекты отвязываем от сессии:
+    # после коммита и закрытия сессии их поля остаются доступны обработчикам
+    for job in jobs:
+        session.expunge(job)
+    return jobs
+
+
+async def orm_get_next_job_time(session: AsyncSession):
+    query = select(func.min(ScheduledJob.run_at))
+    return await session.scalar(query)
+
+
+######################## Запрещенные слова #######################################
+
+async def orm_add_restricted_words(session: AsyncSession, words):
+    # Уже существующие слова пропускаются, поэтому можно вызывать при каждом старте
+    words = {word.strip().lower() for word in words if word.strip()}
+    if not words:
+        return
+    query = (
+        dialect_insert(session, RestrictedWord)
+        .values([{"word": word} for word in words])
+        .on_conflict_do_nothing(index_elements=[RestrictedWord.word])
+    )
+    await session.execute(query)
+    await orm_bump_restricted_words_version(session)
+
+
+async def orm_create_restricted_words(session: AsyncSession, words):
+    # Встроенный список кладем только в пустую таблицу, чтобы не вернуть слова,
+    # которые админ уже удалил
+    query = select(RestrictedWord.id).limit(1)
+    result = await session.execute(query)
+    if result.first():
+        return
+    await orm_add_restricted_words(session, words)
+
+
+async def orm_delete_restricted_word(session: AsyncSession, word: str):
+    query = delete(RestrictedWord).where(RestrictedWord.word == word.strip().lower())
+    await session.execute(query)
+    await orm_bump_restricted_words_version(session)
+
+
+async def orm_bump_restricted_words_version(session: AsyncSession):
+    # Счетчик растет в той же транзакции, что и правка списка. По количеству слов
+    # и max(id) правку не заметить: SQLite отдает новому слову id удаленного
+    query = update(RestrictedWordVersion).values(version=RestrictedWordVersion.version + 1)
+    await session.execute(query)
+
+
+async def orm_get_restricted_words_version(session: AsyncSession):
+    # Дешевая проверка, изменился ли список
+    return await session.scalar(select(RestrictedWordVersion.version))
+
+
+async def orm_get_restricted_words(session: AsyncSession):
+    query = select(RestrictedWord.word)
     result = await session.execute(query)
     return result.scalars().all()
 
 
+######################## Администраторы групп #######################################
 
+async def orm_set_chat_admins(session: AsyncSession, chat_id: int, user_ids):
+    # Список админов группы заменяется целиком
+    await orm_delete_chat_admins(session, chat_id)
+    if user_ids:
+        query = insert(ChatAdmin).values(
+            [{"chat_id": chat_id, "user_id": user_id} for user_id in set(user_ids)]
+        )
+        await session.execute(query)
+
+
+async def orm_delete_chat_admins(session: AsyncSession, chat_id: int):
+    query = delete(ChatAdmin).where(ChatAdmin.chat_id == chat_id)
+    await session.execute(query)
+
+
+async def orm_get_chat_admins(session: AsyncSession):
+    query = select(ChatAdmin.chat_id, ChatAdmin.user_id)
+    result = await session.execute(query)
+    return result.all()
 
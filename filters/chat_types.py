@@ -1,5 +1,7 @@
 from aiogram.filters import Filter
-from aiogram import Bot, types
+from aiogram import types
+
+from utils.admins import admin_registry
 
 
 class ChatTypeFilter(Filter):
@@ -13,5 +15,5 @@ class IsAdmin(Filter):
     def __init__(self) -> None:
         pass
 
-    async def __call__(self, message: types.Message, bot: Bot) -> bool:
-        return message.from_user.id in bot.my_admins_list
\ No newline at end of file
+    async def __call__(self, message: types.Message) -> bool:
+        return message.from_user.id in admin_registry
\ No newline at end of file
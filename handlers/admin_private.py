@@ -1,21 +1,27 @@
 from aiogram import F, Router, types
-from aiogram.filters import Command, StateFilter, or_f
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject, StateFilter, or_f
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import InputMediaPhoto
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.orm_query import (
+    on_commit,
+    orm_add_restricted_words,
+    orm_delete_restricted_word,
     orm_change_banner_image,
     orm_get_categories,
     orm_add_product,
     orm_delete_product,
     orm_get_info_pages,
     orm_get_product,
-    orm_get_products,
+    orm_get_products_page,
     orm_update_product,
-    orm_get_user_orders,
-    orm_get_order_items,
+    orm_get_pending_orders_page,
+    orm_commit,
+    orm_rollback,
     orm_update_order,
 )
 
@@ -24,9 +30,13 @@ from filters.chat_types import ChatTypeFilter, IsAdmin
 from kbds.inline import get_callback_btns
 from kbds.reply import get_keyboard, del_reply_kd
 
+from utils.moderation import word_filter
+from utils.paginator import Paginator
+
 
 admin_router = Router()
 admin_router.message.filter(ChatTypeFilter(["private"]), IsAdmin())
+admin_router.callback_query.filter(IsAdmin())
 
 
 ADMIN_KB = get_keyboard(
@@ -39,16 +49,41 @@ ADMIN_KB = get_keyboard(
 )
 
 
-@admin_router.message(Command("admin"))
+@admin_router.message(Command("admin"), flags={"no_db": True})
 async def admin_on(message: types.Message):
     await message.answer("Что хотите сделать?", reply_markup=ADMIN_KB)
 
 
-@admin_router.message(Command("off_admin"))
+@admin_router.message(Command("off_admin"), flags={"no_db": True})
 async def admin_off(message: types.Message):
     await message.answer("Админ клавиатура удалена", reply_markup=del_reply_kd)
 
 
+# Список запрещенных слов для групп: /add_word слово [слово ...], /del_word слово.
+# Слово с '*' на конце - основа (кабан* запретит и "кабанчик")
+@admin_router.message(Command("add_word"))
+async def add_restricted_words(message: types.Message, command: CommandObject, session: AsyncSession):
+    if not command.args:
+        await message.answer("Напишите слова после команды, например: /add_word кабан хомяк*")
+        return
+    await orm_add_restricted_words(session, command.args.split())
+    on_commit(session, word_filter.reload_now)
+    await orm_commit(session)
+    await message.answer("Слова добавлены в список запрещенных")
+
+
+@admin_router.message(Command("del_word"))
+async def delete_restricted_word(message: types.Message, command: CommandObject, session: AsyncSession):
+    if not command.args:
+        await message.answer("Напишите слово после команды, например: /del_word кабан")
+        return
+    for word in command.args.split():
+        await orm_delete_restricted_word(session, word)
+    on_commit(session, word_filter.reload_now)
+    await orm_commit(session)
+    await message.answer("Слова удалены из списка запрещенных")
+
+
 @admin_router.message(F.text == 'Ассортимент')
 async def admin_features(message: types.Message, session: AsyncSession):
     categories = await orm_get_categories(session)
@@ -56,62 +91,161 @@ async def admin_features(message: types.Message, session: AsyncSession):
     await message.answer("Выберите категорию", reply_markup=get_callback_btns(btns=btns))
 
 
+def page_numbers(page: int, pages: int, window: int = 2, jumps: tuple[int, ...] = (10, 100)):
+    # Номера страниц для быстрого перехода: первая, последняя, несколько вокруг текущей
+    # и прыжки на jumps страниц в обе стороны, чтобы большую категорию не листать по одной
+    if pages <= 1:
+        return []
+    numbers = {1, pages, *range(max(page - window, 1), min(page + window, pages) + 1)}
+    for jump in jumps:
+        numbers.update(number for number in (page - jump, page + jump) if 1 <= number <= pages)
+    return sorted(numbers)
+
+
+# Товары категории показываются одним сообщением, которое листается на месте,
+# поэтому просмотр не зависит от размера каталога
+async def admin_products_page(session: AsyncSession, category_id: int, page: int):
+    paginator = Paginator(await orm_get_products_page(session, category_id=category_id, page=page))
+
+    if not paginator.array:
+        return None, None
+
+    product = paginator.get_page()[0]
+    image = InputMediaPhoto(
+        media=product.image,
+        caption=f"<strong>{product.name}\
+                </strong>\n{product.description}\nСтоимость: {round(product.price, 2)}₽\n\
+                <strong>Товар {paginator.page} из {paginator.pages}</strong>",
+    )
+
+    btns = {
+        "Удалить": f"delete_{product.id}_{category_id}_{paginator.page}",
+        "Изменить": f"change_{product.id}",
+    }
+    pagination_btns = {}
+    if paginator.has_previous():
+        pagination_btns["◀ Пред."] = f"admin_products_{category_id}_{paginator.has_previous()}"
+    if paginator.has_next():
+        pagination_btns["След. ▶"] = f"admin_products_{category_id}_{paginator.has_next()}"
+    btns.update(pagination_btns)
+
+    numbers = page_numbers(paginator.page, paginator.pages)
+    for number in numbers:
+        text = f"· {number} ·" if number == paginator.page else str(number)
+        btns[text] = f"admin_products_{category_id}_{number}"
+
+    # Номера страниц - рядами не длиннее 5 кнопок
+    sizes = tuple(size for size in (2, len(pagination_btns), min(len(numbers), 5)) if size)
+    return image, get_callback_btns(btns=btns, sizes=sizes)
+
+
 @admin_router.callback_query(F.data.startswith('category_'))
 async def starring_at_product(callback: types.CallbackQuery, session: AsyncSession):
-    category_id = callback.data.split('_')[-1]
-    for product in await orm_get_products(session, int(category_id)):
-        await callback.message.answer_photo(
-            product.image,
-            caption=f"<strong>{product.name}\
-                    </strong>\n{product.description}\nСтоимость: {round(product.price, 2)}₽",
-            reply_markup=get_callback_btns(
-                btns={
-                    "Удалить": f"delete_{product.id}",
-                    "Изменить": f"change_{product.id}",
-                },
-                sizes=(2,)
-            ),
-        )
+    category_id = int(callback.data.split('_')[-1])
+    image, reply_markup = await admin_products_page(session, category_id, page=1)
+    if image is None:
+        await callback.answer("В этой категории нет товаров", show_alert=True)
+        return
+    await callback.message.answer_photo(image.media, caption=image.caption, reply_markup=reply_markup)
+    await callback.answer()
+
+
+@admin_router.callback_query(F.data.startswith("admin_products_"))
+async def admin_products_list_page(callback: types.CallbackQuery, session: AsyncSession):
+    category_id, page = map(int, callback.data.split("_")[2:])
+    image, reply_markup = await admin_products_page(session, category_id, page=page)
+    await edit_products_message(callback, image, reply_markup)
     await callback.answer()
-    await callback.message.answer("ОК, вот список товаров ⏫")
+
+
+async def edit_products_message(callback: types.CallbackQuery, image, reply_markup):
+    if image is None:
+        await callback.message.delete()
+        await callback.message.answer("В этой категории больше нет товаров")
+        return
+    try:
+        await callback.message.edit_media(media=image, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        # Нажали на номер текущей страницы
+        if "message is not modified" not in str(e):
+            raise
 
 
 @admin_router.callback_query(F.data.startswith("delete_"))
 async def delete_product_callback(callback: types.CallbackQuery, session: AsyncSession):
-    product_id = callback.data.split("_")[-1]
+    # delete_<id товара>_<id категории>_<страница> (в старых сообщениях только id товара)
+    product_id, *position = callback.data.split("_")[1:]
+    # Фиксируем удаление сразу, чтобы снимок каталога пересобрался до перерисовки
     await orm_delete_product(session, int(product_id))
+    await orm_commit(session)
 
+    if not position:
+        await callback.answer("Товар удален")
+        await callback.message.answer("Товар удален!")
+        return
+
+    category_id, page = map(int, position)
+    image, reply_markup = await admin_products_page(session, category_id, page=page)
+    await edit_products_message(callback, image, reply_markup)
     await callback.answer("Товар удален")
-    await callback.message.answer("Товар удален!")
 
 
-@admin_router.message(F.text == 'Заказы')
-async def admin_orders_list(message: types.Message, session: AsyncSession):
-    for order in await orm_get_user_orders(session):
+# Очередь заказов показывается одним сообщением, которое листается и обновляется на месте
+async def admin_orders_page(session: AsyncSession, page: int):
+    paginator = Paginator(await orm_get_pending_orders_page(session, page=page))
+
+    if not paginator.array:
+        return "Невыполненных заказов нет", None
+
+    orders_text = []
+    btns = {}
+    for order in paginator.get_page():
         order_text = f"Заказ номер: {order.id}\n Получатель: {order.user.first_name}\n Телефон: {order.user.phone} \n Доставка: {order.delivery_address}\n \n Заказано:\n"
         all_order_price = 0
-        order_id = order.id
-        for order_item in await orm_get_order_items(session, order_id=order_id):
+        for order_item in order.order_items:
             order_text = order_text + f"{order_item.product.name} х {order_item.quantity} \n"
             all_order_price = all_order_price + order_item.product.price * order_item.quantity
 
         order_text = order_text + f"\n Итого: {round(all_order_price, 2)}₽"
-        await message.answer(
-            order_text, 
-            reply_markup=get_callback_btns(
-                btns={
-                    "Заказ готов": f"order_update_{order.id}",
-                },
-                sizes=(1,)
-            ),
-        )
+        orders_text.append(order_text)
+        btns[f"Заказ готов №{order.id}"] = f"order_update_{order.id}_{paginator.page}"
+
+    pagination_btns = {}
+    if paginator.has_previous():
+        pagination_btns["◀ Пред."] = f"admin_orders_{paginator.has_previous()}"
+    if paginator.has_next():
+        pagination_btns["След. ▶"] = f"admin_orders_{paginator.has_next()}"
+    btns.update(pagination_btns)
+
+    text = "\n----------------------\n".join(orders_text)
+    text = text + f"\n\nСтраница {paginator.page} из {paginator.pages}"
+    sizes = (1,) * len(orders_text) + (2,)
+    return text, get_callback_btns(btns=btns, sizes=sizes)
+
+
+@admin_router.message(F.text == 'Заказы')
+async def admin_orders_list(message: types.Message, session: AsyncSession):
+    text, reply_markup = await admin_orders_page(session, page=1)
+    await message.answer(text, reply_markup=reply_markup)
+
+
+@admin_router.callback_query(F.data.startswith("admin_orders_"))
+async def admin_orders_list_page(callback: types.CallbackQuery, session: AsyncSession):
+    page = int(callback.data.split("_")[-1])
+    text, reply_markup = await admin_orders_page(session, page=page)
+    await callback.message.edit_text(text, reply_markup=reply_markup)
+    await callback.answer()
 
 
 @admin_router.callback_query(F.data.startswith("order_update_"))
 async def order_is_ready(callback: types.CallbackQuery, session: AsyncSession):
-    order_id = callback.data.split("_")[-1]
-    await orm_update_order(session, order_id=order_id)
+    # order_update_<id заказа>_<страница очереди> (в старых сообщениях страницы нет)
+    order_id, *page = callback.data.split("_")[2:]
+    await orm_update_order(session, order_id=int(order_id))
+    await orm_commit(session)
 
+    text, reply_markup = await admin_orders_page(session, page=int(page[0]) if page else 1)
+    await callback.message.edit_text(text, reply_markup=reply_markup)
     await callback.answer("Заказ выполнен")
 
 
@@ -141,11 +275,12 @@ async def add_banner(message: types.Message, state: FSMContext, session: AsyncSe
                          \n{', '.join(pages_names)}")
         return
     await orm_change_banner_image(session, for_page, image_id,)
+    await orm_commit(session)
     await message.answer("Баннер добавлен/изменен.")
     await state.clear()
 
 # ловим некоррекный ввод
-@admin_router.message(AddBanner.image)
+@admin_router.message(AddBanner.image, flags={"no_db": True})
 async def add_banner2(message: types.Message, state: FSMContext):
     await message.answer("Отправьте фото баннера или отмена")
 
@@ -193,7 +328,7 @@ async def change_product_callback(
 
 
 # Становимся в состояние ожидания ввода name
-@admin_router.message(StateFilter(None), F.text == "Добавить товар")
+@admin_router.message(StateFilter(None), F.text == "Добавить товар", flags={"no_db": True})
 async def add_product(message: types.Message, state: FSMContext):
     await message.answer(
         "Введите название товара", reply_markup=types.ReplyKeyboardRemove()
@@ -203,8 +338,8 @@ async def add_product(message: types.Message, state: FSMContext):
 
 # Хендлер отмены и сброса состояния должен быть всегда именно здесь,
 # после того, как только встали в состояние номер 1 (элементарная очередность фильтров)
-@admin_router.message(StateFilter("*"), Command("отмена"))
-@admin_router.message(StateFilter("*"), F.text.casefold() == "отмена")
+@admin_router.message(StateFilter("*"), Command("отмена"), flags={"no_db": True})
+@admin_router.message(StateFilter("*"), F.text.casefold() == "отмена", flags={"no_db": True})
 async def cancel_handler(message: types.Message, state: FSMContext) -> None:
     current_state = await state.get_state()
     if current_state is None:
@@ -216,8 +351,8 @@ async def cancel_handler(message: types.Message, state: FSMContext) -> None:
 
 
 # Вернутся на шаг назад (на прошлое состояние)
-@admin_router.message(StateFilter("*"), Command("назад"))
-@admin_router.message(StateFilter("*"), F.text.casefold() == "назад")
+@admin_router.message(StateFilter("*"), Command("назад"), flags={"no_db": True})
+@admin_router.message(StateFilter("*"), F.text.casefold() == "назад", flags={"no_db": True})
 async def back_step_handler(message: types.Message, state: FSMContext) -> None:
     current_state = await state.get_state()
 
@@ -239,7 +374,7 @@ async def back_step_handler(message: types.Message, state: FSMContext) -> None:
 
 
 # Ловим данные для состояние name и потом меняем состояние на description
-@admin_router.message(AddProduct.name, F.text)
+@admin_router.message(AddProduct.name, F.text, flags={"no_db": True})
 async def add_name(message: types.Message, state: FSMContext):
     if message.text == "." and AddProduct.product_for_change:
         await state.update_data(name=AddProduct.product_for_change.name)
@@ -258,7 +393,7 @@ async def add_name(message: types.Message, state: FSMContext):
     await state.set_state(AddProduct.description)
 
 # Хендлер для отлова некорректных вводов для состояния name
-@admin_router.message(AddProduct.name)
+@admin_router.message(AddProduct.name, flags={"no_db": True})
 async def add_name2(message: types.Message, state: FSMContext):
     await message.answer("Вы ввели не допустимые данные, введите текст названия товара")
 
@@ -282,7 +417,7 @@ async def add_description(message: types.Message, state: FSMContext, session: As
     await state.set_state(AddProduct.category)
 
 # Хендлер для отлова некорректных вводов для состояния description
-@admin_router.message(AddProduct.description)
+@admin_router.message(AddProduct.description, flags={"no_db": True})
 async def add_description2(message: types.Message, state: FSMContext):
     await message.answer("Вы ввели не допустимые данные, введите текст описания товара")
 
@@ -300,13 +435,13 @@ async def category_choice(callback: types.CallbackQuery, state: FSMContext , ses
         await callback.answer()
 
 #Ловим любые некорректные действия, кроме нажатия на кнопку выбора категории
-@admin_router.message(AddProduct.category)
+@admin_router.message(AddProduct.category, flags={"no_db": True})
 async def category_choice2(message: types.Message, state: FSMContext):
     await message.answer("'Выберите катеорию из кнопок.'") 
 
 
 # Ловим данные для состояние price и потом меняем состояние на image
-@admin_router.message(AddProduct.price, F.text)
+@admin_router.message(AddProduct.price, F.text, flags={"no_db": True})
 async def add_price(message: types.Message, state: FSMContext):
     if message.text == "." and AddProduct.product_for_change:
         await state.update_data(price=AddProduct.product_for_change.price)
@@ -322,7 +457,7 @@ async def add_price(message: types.Message, state: FSMContext):
     await state.set_state(AddProduct.image)
 
 # Хендлер для отлова некорректных ввода для состояния price
-@admin_router.message(AddProduct.price)
+@admin_router.message(AddProduct.price, flags={"no_db": True})
 async def add_price2(message: types.Message, state: FSMContext):
     await message.answer("Вы ввели не допустимые данные, введите стоимость товара")
 
@@ -344,10 +479,12 @@ async def add_image(message: types.Message, state: FSMContext, session: AsyncSes
             await orm_update_product(session, AddProduct.product_for_change.id, data)
         else:
             await orm_add_product(session, data)
+        await orm_commit(session)
         await message.answer("Товар добавлен/изменен", reply_markup=ADMIN_KB)
         await state.clear()
 
     except Exception as e:
+        await orm_rollback(session)
         await message.answer(
             f"Ошибка: \n{str(e)}\nОбратись к программеру, он опять денег хочет",
             reply_markup=ADMIN_KB,
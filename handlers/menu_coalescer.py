@@ -0,0 +1,145 @@
+# Склейка частых нажатий в inline меню.
+# Нажатия одного пользователя в одном сообщении меню копятся в пачку, пока он жмет
+# чаще, чем раз в window секунд (но не дольше max_delay): изменения корзины (+1/-1/удалить)
+# суммируются и пишутся в БД одной транзакцией, а меню перерисовывается один раз -
+# по последнему нажатию. Пачки одного сообщения применяются строго по очереди
+import asyncio
+import logging
+import os
+
+from aiogram import types
+
+from database.orm_query import orm_change_cart_quantity, orm_commit, orm_delete_from_cart
+
+from handlers.menu_processing import get_menu_content
+
+from kbds.inline import MenuCallBack
+
+from utils.render import edit_menu
+
+
+logger = logging.getLogger(__name__)
+
+
+CART_DELTAS = {"increment": 1, "decrement": -1}
+
+
+class TapBatch:
+    def __init__(self, message: types.Message, user_id: int, now: float):
+        self.message = message
+        self.user_id = user_id
+        self.first_at = now
+        self.last_at = now
+        self.callback_data: MenuCallBack | None = None
+        self.deltas: dict[int, int] = {}
+        self.deletes: set[int] = set()
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def add(self, callback_data: MenuCallBack, now: float) -> None:
+        self.last_at = now
+        self.callback_data = callback_data
+        product_id = callback_data.product_id
+        if callback_data.menu_name in CART_DELTAS:
+            self.deltas[product_id] = self.deltas.get(product_id, 0) + CART_DELTAS[callback_data.menu_name]
+        elif callback_data.menu_name == "delete":
+            # Накопленные до удаления +1/-1 этого товара уже не важны
+            self.deltas.pop(product_id, None)
+            self.deletes.add(product_id)
+
+
+class MenuCoalescer:
+    def __init__(self, window: float = 0.3, max_delay: float = 1.0):
+        self.window = window
+        self.max_delay = max_delay
+        self.session_pool = None
+        self._batches: dict[tuple[int, int], TapBatch] = {}
+        self._applying: dict[tuple[int, int], asyncio.Task] = {}
+
+    def setup(self, session_pool) -> None:
+        self.session_pool = session_pool
+
+    def submit(self, callback: types.CallbackQuery, callback_data: MenuCallBack) -> None:
+        now = asyncio.get_running_loop().time()
+        key = (callback.from_user.id, callback.message.message_id)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = TapBatch(callback.message, callback.from_user.id, now)
+            batch.task = asyncio.create_task(self._run(key, batch))
+        batch.add(callback_data, now)
+
+    async def flush(self, user_id: int, message_id: int) -> None:
+        # Применить накопленное сразу (например, перед оформлением заказа)
+        batch = self._batches.get((user_id, message_id))
+        if batch is not None:
+            batch.wakeup.set()
+            await batch.task
+        applying = self._applying.get((user_id, message_id))
+        if applying is not None:
+            await applying
+
+    async def close(self) -> None:
+        # Копящиеся пачки применяем сразу и дожидаемся тех, что уже пишутся в БД
+        for batch in list(self._batches.values()):
+            batch.wakeup.set()
+        await asyncio.gather(
+            *(batch.task for batch in list(self._batches.values())),
+            *list(self._applying.values()),
+        )
+
+    async def _run(self, key: tuple[int, int], batch: TapBatch) -> None:
+        loop = asyncio.get_running_loop()
+        while not batch.wakeup.is_set():
+            delay = min(batch.last_at + self.window, batch.first_at + self.max_delay) - loop.time()
+            if delay <= 0:
+                break
+            try:
+                await asyncio.wait_for(batch.wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+        # Новые нажатия пойдут уже в следующую пачку
+        del self._batches[key]
+        previous = self._applying.get(key)
+        self._applying[key] = asyncio.current_task()
+        try:
+            if previous is not None:
+                await previous
+            await self._apply(batch)
+        finally:
+            if self._applying.get(key) is asyncio.current_task():
+                del self._applying[key]
+
+    async def _apply(self, batch: TapBatch) -> None:
+        data = batch.callback_data
+        try:
+            async with self.session_pool() as session:
+                for product_id in batch.deletes:
+                    await orm_delete_from_cart(session, batch.user_id, product_id)
+                for product_id, delta in batch.deltas.items():
+                    if delta:
+                        await orm_change_cart_quantity(session, batch.user_id, product_id, delta)
+
+                # Изменения уже применены, поэтому корзину только рисуем
+                menu_name = "cart" if data.menu_name in (*CART_DELTAS, "delete") else data.menu_name
+                media, reply_markup = await get_menu_content(
+                    session,
+                    level=data.level,
+                    menu_name=menu_name,
+                    category=data.category,
+                    page=data.page,
+                    product_id=data.product_id,
+                    user_id=batch.user_id,
+                    cursor=data.cursor,
+                )
+                await orm_commit(session)
+
+            await edit_menu(batch.message, media, reply_markup)
+        except Exception:
+            logger.exception("Не удалось применить нажатия пользователя %s", batch.user_id)
+
+
+menu_coalescer = MenuCoalescer(
+    window=float(os.getenv('MENU_DEBOUNCE', 0.3)),
+    max_delay=float(os.getenv('MENU_DEBOUNCE_MAX', 1.0)),
+)
@@ -3,15 +3,16 @@ from aiogram.types import InputMediaPhoto
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from database.models import Cart
+
 from database.orm_query import (
     orm_add_to_cart,
     orm_delete_from_cart,
     orm_get_banner,
-    orm_get_categories,
-    orm_get_order_items,
-    orm_get_products,
-    orm_get_user_carts,
-    orm_get_user_orders2,
+    orm_get_catalog,
+    orm_get_products_page,
+    orm_get_cart_summary_query,
+    orm_get_user_orders_page,
     orm_reduce_product_in_cart,
 )
 
@@ -23,7 +24,7 @@ from kbds.inline import (
     get_user_orders_btns,
 )
 
-from utils.paginator import Paginator
+from utils.paginator import KeysetPaginator, Paginator
 
 
 async def main_menu(session, level, menu_name):
@@ -39,8 +40,8 @@ async def catalog(session, level, menu_name):
     banner = await orm_get_banner(session, menu_name)
     image = InputMediaPhoto(media=banner.image, caption=banner.description)
 
-    categories = await orm_get_categories(session)
-    kbds = get_user_catalog_btns(level=level, categories=categories)
+    catalog = await orm_get_catalog(session)
+    kbds = get_user_catalog_btns(level=level, categories=catalog.categories)
 
     return image, kbds
 
@@ -56,10 +57,21 @@ def pages(paginator: Paginator):
     return btns
 
 
+def cursor_pages(paginator: KeysetPaginator):
+    btns = dict()
+    if paginator.has_previous():
+        btns["◀ Пред."] = paginator.has_previous()
+
+    if paginator.has_next():
+        btns["След. ▶"] = paginator.has_next()
+
+    return btns
+
+
 async def products(session, level, category, page):
-    products = await orm_get_products(session, category_id=category)
+    products_page = await orm_get_products_page(session, category_id=category, page=page)
 
-    paginator = Paginator(products, page=page)
+    paginator = Paginator(products_page)
     product = paginator.get_page()[0]
 
     image = InputMediaPhoto(
@@ -74,7 +86,7 @@ async def products(session, level, category, page):
     kbds = get_products_btns(
         level=level,
         category=category,
-        page=page,
+        page=paginator.page,
         pagination_btns=pagination_btns,
         product_id=product.id,
     )
@@ -82,21 +94,27 @@ async def products(session, level, category, page):
     return image, kbds
 
 
-async def carts(session, level, menu_name, page, user_id, product_id):
+async def carts(session, level, menu_name, cursor, user_id, product_id):
+    # Корзина листается по курсору (id строки корзины), поэтому после удаления
+    # товара соседние страницы не съезжают
     if menu_name == "delete":
         await orm_delete_from_cart(session, user_id, product_id)
-        if page > 1:
-            page -= 1
     elif menu_name == "decrement":
-        is_cart = await orm_reduce_product_in_cart(session, user_id, product_id)
-        if page > 1 and not is_cart:
-            page -= 1
+        await orm_reduce_product_in_cart(session, user_id, product_id)
     elif menu_name == "increment":
         await orm_add_to_cart(session, user_id, product_id)
 
-    carts = await orm_get_user_carts(session, user_id)
+    paginator = KeysetPaginator(
+        session,
+        orm_get_cart_summary_query(user_id),
+        Cart.id,
+        cursor=cursor,
+        scalars=False,
+        get_key=lambda row: row[0].id,
+    )
+    page = await paginator.get_page()
 
-    if not carts:
+    if not page:
         banner = await orm_get_banner(session, "cart")
         image = InputMediaPhoto(
             media=banner.image, caption=f"<strong>{banner.description}</strong>"
@@ -104,31 +122,27 @@ async def carts(session, level, menu_name, page, user_id, product_id):
 
         kbds = get_user_cart_btns(
             level=level,
-            page=None,
+            cursor=None,
             pagination_btns=None,
             product_id=None,
         )
 
     else:
-        paginator = Paginator(carts, page=page)
-
-        cart = paginator.get_page()[0]
+        cart, total_price, items_count, position = page[0]
 
         cart_price = round(cart.quantity * cart.product.price, 2)
-        total_price = round(
-            sum(cart.quantity * cart.product.price for cart in carts), 2
-        )
+        total_price = round(total_price, 2)
         image = InputMediaPhoto(
             media=cart.product.image,
             caption=f"<strong>{cart.product.name}</strong>\n{cart.product.price}₽ x {cart.quantity} = {cart_price}₽\
-                    \nТовар {paginator.page} из {paginator.pages} в корзине.\nОбщая стоимость товаров в корзине {total_price}₽",
+                    \nТовар {position} из {items_count} в корзине.\nОбщая стоимость товаров в корзине {total_price}₽",
         )
 
-        pagination_btns = pages(paginator)
+        pagination_btns = cursor_pages(paginator)
 
         kbds = get_user_cart_btns(
             level=level,
-            page=page,
+            cursor=cursor,
             pagination_btns=pagination_btns,
             product_id=cart.product.id,
         )
@@ -136,12 +150,10 @@ async def carts(session, level, menu_name, page, user_id, product_id):
     return image, kbds
 
 async def orders(session, level, page, user_id):
+    orders_page = await orm_get_user_orders_page(session, user_id=user_id, page=page)
+    banner = await orm_get_banner(session, "orders")
 
-
-    user_orders = await orm_get_user_orders2(session, user_id=user_id)
-
-    if not user_orders:
-        banner = await orm_get_banner(session, "orders")
+    if not orders_page.items:
         image = InputMediaPhoto(
             media=banner.image, caption=f"<strong>{banner.description}</strong>"
         )
@@ -153,27 +165,24 @@ async def orders(session, level, page, user_id):
         )
     else:
 
-        paginator = Paginator(user_orders, page=page)
+        paginator = Paginator(orders_page)
         order = paginator.get_page()[0]
 
         order_text = f"Заказ номер: {order.id}\n Получатель: {order.user.first_name}\n Телефон: {order.user.phone} \n Доставка: {order.delivery_address}\n \n Заказано:\n"
         all_order_price = 0
-        order_id = order.id
-        for order_item in await orm_get_order_items(session, order_id=order_id):
+        for order_item in order.order_items:
             order_text = order_text + f"{order_item.product.name} х {order_item.quantity} \n"
             all_order_price = all_order_price + order_item.product.price * order_item.quantity
 
         order_text = order_text + f"\n Итого: {round(all_order_price, 2)}₽ \n Статус заказа: {order.status}"
 
-        banner = await orm_get_banner(session, menu_name="orders")
-
         image = InputMediaPhoto(media=banner.image, caption=order_text)
 
         pagination_btns = pages(paginator)
 
         kbds = get_user_orders_btns(
             level=level,
-            page=page,
+            page=paginator.page,
             pagination_btns=pagination_btns,
         )
 
@@ -188,6 +197,7 @@ async def get_menu_content(
     page: int | None = None,
     product_id: int | None = None,
     user_id: int | None = None,
+    cursor: str | None = None,
 ):
     if level == 0:
         return await main_menu(session, level, menu_name)
@@ -196,6 +206,6 @@ async def get_menu_content(
     elif level == 2:
         return await products(session, level, category, page)
     elif level == 3:
-        return await carts(session, level, menu_name, page, user_id, product_id)
+        return await carts(session, level, menu_name, cursor, user_id, product_id)
     elif level == 4:
         return await orders(session, level, page, user_id)
@@ -1,10 +1,13 @@
-from string import punctuation
-
 from aiogram import F, Bot, types, Router
 from aiogram.filters import Command
 
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.orm_query import orm_commit
+
 from filters.chat_types import ChatTypeFilter
-from common.restricted_words import restricted_words
+from utils.admins import admin_registry
+from utils.moderation import word_filter
 
 
 user_group_router = Router()
@@ -13,31 +16,22 @@ user_group_router.edited_message.filter(ChatTypeFilter(["group", "supergroup"]))
 
 
 @user_group_router.message(Command("admin"))
-async def get_admins(message: types.Message, bot: Bot):
-    chat_id = message.chat.id
-    admins_list = await bot.get_chat_administrators(chat_id)
-    #просмотреть все данные и свойства полученных объектов
-    #print(admins_list)
-    # Код ниже это генератор списка, как и этот x = [i for i in range(10)]
-    admins_list = [
-        member.user.id
-        for member in admins_list
-        if member.status == "creator" or member.status == "administrator"
-    ]
-    bot.my_admins_list = admins_list
+async def get_admins(message: types.Message, bot: Bot, session: AsyncSession):
+    # Обновляем реестр админов этой группы (utils/admins.py), он сохраняется в БД
+    admins_list = await admin_registry.refresh_chat(bot, session, message.chat.id)
+    await orm_commit(session)
     if message.from_user.id in admins_list:
         await message.delete()
-    #print(admins_list)
-
-
-def clean_text(text: str):
-    return text.translate(str.maketrans("", "", punctuation))
 
 
-@user_group_router.edited_message()
-@user_group_router.message()
+@user_group_router.edited_message(flags={"no_db": True})
+@user_group_router.message(flags={"no_db": True})
 async def cleaner(message: types.Message):
-    if restricted_words.intersection(clean_text(message.text.lower()).split()):
+    # У фото, стикеров и т.п. текста нет, проверяем подпись, если она есть
+    text = message.text or message.caption
+    if not text:
+        return
+    if word_filter.find(text):
         await message.answer(
             f"{message.from_user.first_name}, соблюддайте порядок в чате!"
         )
@@ -1,6 +1,7 @@
-import asyncio
+import os
 
-from aiogram import F, types, Router
+from aiogram import F, Bot, types, Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -10,26 +11,29 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.orm_query import (
     orm_add_message,
-    orm_add_order,
-    orm_delete_from_cart,
+    orm_checkout,
     orm_delete_message,
     orm_add_to_cart,
-    orm_get_user_carts,
     orm_add_user,
-    orm_update_user,
-    orm_add_order_items,
+    orm_commit,
 )
 
 from filters.chat_types import ChatTypeFilter
 
+from handlers.menu_coalescer import menu_coalescer
 from handlers.menu_processing import get_menu_content
 
 from kbds.inline import MenuCallBack
 from kbds.reply import get_keyboard, del_reply_kd
 
+from utils.render import menu_renders
+from utils.scheduler import scheduler
 
 
 
+
+MENU_TTL = int(os.getenv('MENU_TTL', 10800))
+
 user_private_router = Router()
 user_private_router.message.filter(ChatTypeFilter(["private"]))
 
@@ -57,23 +61,34 @@ PHONE_KB = get_keyboard(
 async def inline_kb_create(message: types.Message, session: AsyncSession):
     media, reply_markup = await get_menu_content(session, level=0, menu_name="main")
     msg = await message.answer_photo(media.media, caption=media.caption, reply_markup=reply_markup)
+    menu_renders.remember(msg, media, reply_markup)
    
    
     '''
-    Код ниже удаляет inline клавиатуру через некоторое время. В рабочем режиме через 3 часа или 10800 секунд.
-    Этот же код сохраняет id сообщения в БД, благодаря чему можно будет удалить клавиатуру при запуске FSM для 
-    создания заказа.
+    Inline клавиатура удаляется через некоторое время (MENU_TTL, в рабочем режиме 3 часа или 10800 секунд).
+    Удаление - это отложенная задача в БД, ее выполнит планировщик (utils/scheduler.py),
+    поэтому хендлер не ждет и задача не теряется при перезапуске бота.
     '''
+    await scheduler.schedule(
+        session,
+        "expire_menu",
+        delay=MENU_TTL,
+        chat_id=msg.chat.id,
+        message_id=msg.message_id,
+        user_id=message.from_user.id,
+    )
 
 
-    await asyncio.sleep(20)  # 100800 или 3 часа
+@scheduler.handler("expire_menu")
+async def expire_menu(bot: Bot, session: AsyncSession, job):
     try:
-        await msg.delete()
-        await message.answer("Бот в спящем режиме, но все ваши действия сохранены. Введите команду /start")  
-        await orm_delete_message(session, user_id=user.id)
+        await bot.delete_message(job.chat_id, job.message_id)
+        await bot.send_message(job.chat_id, "Бот в спящем режиме, но все ваши действия сохранены. Введите команду /start")
+        await orm_delete_message(session, user_id=job.user_id)
 
-    except Exception:  
-        pass 
+    except TelegramBadRequest:
+        # Сообщение уже удалено (например, при оформлении заказа)
+        pass
 
 
 @user_private_router.message(CommandStart())
@@ -91,6 +106,7 @@ async def add_to_cart(callback: types.CallbackQuery, callback_data: MenuCallBack
         phone=None,
     )
     await orm_add_to_cart(session, user_id=user.id, product_id=callback_data.product_id)
+    await orm_commit(session)
     await callback.answer("Товар добавлен в корзину.", show_alert=True)
 
 
@@ -111,6 +127,7 @@ async def create_order(callback: types.CallbackQuery, state: FSMContext, session
     try:
         user = callback.from_user
         await orm_delete_message(session, user_id=user.id)
+        await orm_commit(session)
         msg = callback.message
         await msg.delete()
     except Exception:  
@@ -136,7 +153,7 @@ async def cancel_handler(message: types.Message, state: FSMContext, session:Asyn
 
 
 # вернуться на шаг назад
-@user_private_router.message(F.text == "Шаг назад")
+@user_private_router.message(F.text == "Шаг назад", flags={"no_db": True})
 async def back_step_handler(message: types.Message, state: FSMContext) -> None:
     current_state = await state.get_state()
 
@@ -158,7 +175,7 @@ async def back_step_handler(message: types.Message, state: FSMContext) -> None:
 
 
 # Ловим данные для состояние first_name и потом меняем состояние на phone
-@user_private_router.message(Ordering.first_name, F.text)
+@user_private_router.message(Ordering.first_name, F.text, flags={"no_db": True})
 async def first_name(message: types.Message, state: FSMContext):
     
     if 2 > len(message.text) >= 150:
@@ -172,13 +189,13 @@ async def first_name(message: types.Message, state: FSMContext):
     await state.set_state(Ordering.phone)
 
 # Хендлер для отлова некорректных вводов для состояния first_name
-@user_private_router.message(Ordering.first_name)
+@user_private_router.message(Ordering.first_name, flags={"no_db": True})
 async def first_name2(message: types.Message):
     await message.answer("Вы ввели не допустимые данные, введите имя тексом")
 
 
 # Ловим данные для состояние phone и потом меняем состояние на adres
-@user_private_router.message(Ordering.phone, F.contact)
+@user_private_router.message(Ordering.phone, F.contact, flags={"no_db": True})
 async def add_phone(message: types.Message, state: FSMContext):
   
         
@@ -188,7 +205,7 @@ async def add_phone(message: types.Message, state: FSMContext):
     await state.set_state(Ordering.delivery_address)
 
 # Хендлер для отлова некорректных вводов для состояния phone
-@user_private_router.message(Ordering.phone)
+@user_private_router.message(Ordering.phone, flags={"no_db": True})
 async def add_phone2(message: types.Message):
     await message.answer("Чтобы предоставить свой номер телефона, нажмите на кнопку")
 
@@ -208,12 +225,8 @@ async def adres(message: types.Message, state: FSMContext, session: AsyncSession
     user = message.from_user
     data = await state.get_data()
 
-    await orm_update_user(session, user_id=user.id, first_name=data["first_name"], phone=data["phone"])
-    order_id = await orm_add_order(session, user.id, data)
-    await orm_get_user_carts(session, user_id=user.id)
-    for cart in await orm_get_user_carts(session, user_id=user.id):
-        await orm_add_order_items(session, order_id=order_id, product_id=cart.product.id, quantity=cart.quantity)
-        await orm_delete_from_cart(session, user_id=user.id, product_id=cart.product.id)
+    await orm_checkout(session, user_id=user.id, data=data)
+    await orm_commit(session)
 
     await state.clear()
     await inline_kb_create(message, session)
@@ -221,7 +234,7 @@ async def adres(message: types.Message, state: FSMContext, session: AsyncSession
 
 
 # Хендлер для отлова некорректных вводов для состояния adres
-@user_private_router.message(Ordering.delivery_address)
+@user_private_router.message(Ordering.delivery_address, flags={"no_db": True})
 async def adres2(message: types.Message):
     await message.answer("Вы ввели не допустимые данные, введите текст описания товара")
 # Конец FSM машины для создания заказа
@@ -235,20 +248,12 @@ async def user_menu(callback: types.CallbackQuery, callback_data: MenuCallBack,
         return
     
     if callback_data.menu_name == "create_order":
+        # Недописанные +1/-1 должны попасть в корзину до оформления заказа
+        await menu_coalescer.flush(callback.from_user.id, callback.message.message_id)
         await create_order(callback, state, session)
         return
 
-
-    media, reply_markup = await get_menu_content(
-        session,
-        level=callback_data.level,
-        menu_name=callback_data.menu_name,
-        category=callback_data.category,
-        page=callback_data.page,
-        product_id=callback_data.product_id,
-        user_id=callback.from_user.id,
-    )
-
-    await callback.message.edit_media(media=media, reply_markup=reply_markup)
+    # На нажатие отвечаем сразу, а изменения корзины и перерисовка меню
+    # склеиваются для частых нажатий (handlers/menu_coalescer.py)
     await callback.answer()
-
+    menu_coalescer.submit(callback, callback_data)
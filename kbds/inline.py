@@ -13,6 +13,7 @@ class MenuCallBack(CallbackData, prefix="menu_"):
     category: int | None = None
     page: int = 1
     product_id: int | None = None
+    cursor: str | None = None
 
 
 
@@ -104,30 +105,27 @@ def get_products_btns(
 def get_user_cart_btns(
     *,
     level: int,
-    page: int | None,
+    cursor: str | None,
     pagination_btns: dict | None,
     product_id: int | None,
     sizes: tuple[int] = (3,)
 ):
     keyboard = InlineKeyboardBuilder()
-    if page:
+    if product_id:
         keyboard.add(InlineKeyboardButton(text="-1",
-                    callback_data=MenuCallBack(level=level, menu_name="decrement", product_id=product_id, page=page).pack()))
+                    callback_data=MenuCallBack(level=level, menu_name="decrement", product_id=product_id, cursor=cursor).pack()))
         keyboard.add(InlineKeyboardButton(text="Удалить 💥",
-                    callback_data=MenuCallBack(level=level, menu_name="delete", product_id=product_id, page=page).pack()))
+                    callback_data=MenuCallBack(level=level, menu_name="delete", product_id=product_id, cursor=cursor).pack()))
         keyboard.add(InlineKeyboardButton(text="+1",
-                    callback_data=MenuCallBack(level=level, menu_name="increment", product_id=product_id, page=page).pack()))
+                    callback_data=MenuCallBack(level=level, menu_name="increment", product_id=product_id, cursor=cursor).pack()))
         
         keyboard.adjust(*sizes)
 
+        # Здесь значения - это курсоры соседних страниц (см. utils.paginator.KeysetPaginator)
         row = []
-        for text, menu_name in pagination_btns.items():
-            if menu_name == "next":
-                row.append(InlineKeyboardButton(text=text,
-                        callback_data=MenuCallBack(level=level, menu_name=menu_name, page=page + 1).pack()))
-            elif menu_name == "previous":
-                row.append(InlineKeyboardButton(text=text,
-                        callback_data=MenuCallBack(level=level, menu_name=menu_name, page=page - 1).pack()))
+        for text, page_cursor in pagination_btns.items():
+            row.append(InlineKeyboardButton(text=text,
+                    callback_data=MenuCallBack(level=level, menu_name="cart", cursor=page_cursor).pack()))
         
         keyboard.row(*row)
 
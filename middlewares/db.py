@@ -1,12 +1,43 @@
 from typing import Any, Awaitable, Callable, Dict
 
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
 from aiogram.types import Message, TelegramObject
 
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.orm_query import orm_commit, orm_rollback
+
+
+class LazySession:
+    # Прокси над AsyncSession: сама сессия (и соединение из пула) появляется
+    # только при первом обращении хендлера к БД
+    def __init__(self, session_pool: async_sessionmaker):
+        self._session_pool = session_pool
+        self._session: AsyncSession | None = None
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._session is None:
+            self._session = self._session_pool()
+        return getattr(self._session, name)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
 
 
 class DataBaseSession(BaseMiddleware):
+    # Регистрируется как inner-middleware (dp.message, dp.callback_query ...),
+    # чтобы видеть флаги хендлера. Хендлеры, которым БД не нужна,
+    # помечаются flags={"no_db": True} и сессию не получают вовсе.
+    # Один апдейт - одна транзакция: коммит после успешного хендлера, откат при ошибке.
+    # Хендлер, который пишет в БД и потом отправляет сообщения, сам коммитит (orm_commit)
+    # перед отправкой: запрос к Bot API может ждать лимит или retry_after после 429
+    # (middlewares/outbound.py), и открытая транзакция держала бы блокировку записи
     def __init__(self, session_pool: async_sessionmaker):
         self.session_pool = session_pool
 
@@ -17,6 +48,19 @@ class DataBaseSession(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
-        async with self.session_pool() as session:
-            data['session'] = session
+        if get_flag(data, "no_db"):
             return await handler(event, data)
+
+        session = LazySession(self.session_pool)
+        data['session'] = session
+        try:
+            result = await handler(event, data)
+            if session.opened:
+                await orm_commit(session)
+            return result
+        except Exception:
+            if session.opened:
+                await orm_rollback(session)
+            raise
+        finally:
+            await session.close()
@@ -0,0 +1,156 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+
+logger = logging.getLogger(__name__)
+
+
+# Приоритеты исходящих запросов: чем меньше число, тем раньше уходит запрос
+PRIORITY_EDIT = 0   # правки и удаление сообщений - пользователь ждет реакции на кнопку
+PRIORITY_SEND = 1   # обычные ответы хендлеров
+PRIORITY_BULK = 2   # фоновые и массовые рассылки (планировщик, админка)
+
+# Фоновые задачи выставляют себе PRIORITY_BULK: outbound_priority.set(PRIORITY_BULK)
+outbound_priority: ContextVar[int | None] = ContextVar('outbound_priority', default=None)
+
+# Лимиты считаем только для методов, которые пишут в чат
+LIMITED_METHODS = ('send', 'edit', 'delete', 'copy', 'forward')
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        # Через сколько секунд можно будет забрать токен (0 - уже можно)
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        # Telegram ответил 429 - до конца retry_after в этот чат ничего не отправляем
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def is_idle(self, now: float) -> bool:
+        return self.wait_time(now) == 0 and self.tokens >= self.capacity
+
+
+class OutboundRateLimiter(BaseRequestMiddleware):
+    # Middleware сессии бота: каждый запрос, который пишет в чат, ждет токен
+    # из общего ведра (лимит бота) и из ведра своего чата (лимит на чат).
+    # Ожидающие запросы выдаются по приоритету, а при 429 запрос сам
+    # ждет retry_after и повторяется - хендлер просто дольше ждет ответа
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        group_rate: float = 20 / 60,
+        burst: float = 3,
+        max_retries: int = 3,
+        max_chats: int = 10000,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._buckets: dict[int | str, TokenBucket] = {}
+        self._waiting: list[tuple[int, int, int | str, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def __call__(self, make_request, bot, method):
+        if not method.__api_method__.startswith(LIMITED_METHODS):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, 'chat_id', None)
+        priority = outbound_priority.get()
+        if priority is None:
+            priority = PRIORITY_EDIT if method.__api_method__.startswith(('edit', 'delete')) else PRIORITY_SEND
+
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("429 для чата %s, ждем %s с", chat_id, e.retry_after)
+                self._bucket(chat_id).block(e.retry_after)
+                self._wakeup.set()
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # В группах (отрицательный id) лимит строже, чем в личке
+            is_group = isinstance(chat_id, str) or (chat_id is not None and chat_id < 0)
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._buckets[chat_id] = TokenBucket(rate, self.burst)
+        return bucket
+
+    async def acquire(self, chat_id, priority: int = PRIORITY_SEND) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append((priority, next(self._counter), chat_id, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        await future
+
+    def _grant(self) -> float | None:
+        # Выдает токены всем, кому можно, в порядке приоритета.
+        # Возвращает, через сколько секунд освободится следующий токен
+        now = time.monotonic()
+        delay = None
+        waiting = []
+        for item in sorted(self._waiting, key=lambda item: item[:2]):
+            future = item[3]
+            if future.done():
+                continue
+            bucket = self._bucket(item[2])
+            wait = max(self.global_bucket.wait_time(now), bucket.wait_time(now))
+            if wait == 0:
+                self.global_bucket.take()
+                bucket.take()
+                future.set_result(None)
+            else:
+                waiting.append(item)
+                delay = wait if delay is None else min(delay, wait)
+        self._waiting = waiting
+
+        if len(self._buckets) > self.max_chats:
+            busy = {item[2] for item in waiting}
+            for chat_id in [c for c, b in self._buckets.items() if c not in busy and b.is_idle(now)]:
+                del self._buckets[chat_id]
+        return delay
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            delay = self._grant()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
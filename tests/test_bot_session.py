@@ -0,0 +1,137 @@
+# Сессия бота (utils/bot_session.py) против локального поддельного Bot API:
+# повторы только для идемпотентных методов, 502 с HTML страницей, таймауты по методам
+import asyncio
+import random
+import time
+
+import pytest
+from aiogram import Bot
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import ClientDecodeError, TelegramNetworkError, TelegramServerError
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from utils.bot_session import TunedAiohttpSession
+
+
+BAD_GATEWAY = web.Response(status=502, text="<html><body><h1>502 Bad Gateway</h1></body></html>", content_type="text/html")
+ME = {"id": 123456, "is_bot": True, "first_name": "Пиццерия", "username": "pizza_bot"}
+MESSAGE = {
+    "message_id": 1, "date": 1752912000, "text": "ok",
+    "chat": {"id": 100500, "type": "private", "first_name": "Иван"},
+}
+
+
+class FakeBotAPI:
+    # Для каждого метода - очередь ответов; последний ответ повторяется
+    def __init__(self, responses: dict, delays: dict | None = None):
+        self.responses = responses
+        self.delays = delays or {}
+        self.calls = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls.append(method)
+        await asyncio.sleep(self.delays.get(method, 0))
+        queue = self.responses[method]
+        response = queue.pop(0) if len(queue) > 1 else queue[0]
+        if isinstance(response, web.Response):
+            # Объект ответа aiohttp нельзя отправить дважды
+            return web.Response(status=response.status, text=response.text, content_type=response.content_type)
+        return web.json_response(response)
+
+    def server(self) -> TestServer:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return TestServer(app)
+
+
+def ok(result) -> dict:
+    return {"ok": True, "result": result}
+
+
+async def run_with_bot(api: FakeBotAPI, scenario, **session_options):
+    async with api.server() as server:
+        session = TunedAiohttpSession(
+            api=TelegramAPIServer.from_base(str(server.make_url(""))),
+            backoff_base=0,
+            **session_options,
+        )
+        bot = Bot("123456:test-token", session=session)
+        try:
+            return await scenario(bot, session)
+        finally:
+            await session.close()
+
+
+def test_idempotent_method_is_retried_after_html_502():
+    api = FakeBotAPI({"getMe": [BAD_GATEWAY, BAD_GATEWAY, ok(ME)]})
+
+    async def scenario(bot, session):
+        me = await bot.get_me()
+        assert me.username == "pizza_bot"
+        assert session.stats.retries == 2
+
+    asyncio.run(run_with_bot(api, scenario, max_retries=3))
+    assert api.calls == ["getMe"] * 3
+
+
+def test_retries_are_limited():
+    api = FakeBotAPI({"getMe": [BAD_GATEWAY]})
+
+    async def scenario(bot, session):
+        with pytest.raises(TelegramServerError, match="HTTP 502"):
+            await bot.get_me()
+        assert session.stats.errors == 1
+
+    asyncio.run(run_with_bot(api, scenario, max_retries=2))
+    assert api.calls == ["getMe"] * 3
+
+
+def test_send_is_not_retried():
+    api = FakeBotAPI({"sendMessage": [BAD_GATEWAY, ok(MESSAGE)]})
+
+    async def scenario(bot, session):
+        with pytest.raises(TelegramServerError):
+            await bot.send_message(100500, "Заказ принят")
+        assert session.stats.retries == 0
+
+    asyncio.run(run_with_bot(api, scenario, max_retries=3))
+    assert api.calls == ["sendMessage"]
+
+
+def test_non_json_success_is_not_a_server_error():
+    api = FakeBotAPI({"getMe": [web.Response(status=200, text="not json", content_type="text/plain")]})
+
+    async def scenario(bot, session):
+        with pytest.raises(ClientDecodeError):
+            await bot.get_me()
+
+    asyncio.run(run_with_bot(api, scenario, max_retries=3))
+    assert api.calls == ["getMe"]
+
+
+def test_method_timeouts():
+    api = FakeBotAPI({"getMe": [ok(ME)], "sendMessage": [ok(MESSAGE)]}, delays={"getMe": 0.5, "sendMessage": 0.5})
+
+    async def scenario(bot, session):
+        started = time.monotonic()
+        with pytest.raises(TelegramNetworkError):
+            await bot.get_me()
+        assert time.monotonic() - started < 0.5
+        # Для остальных методов действует общий таймаут
+        message = await bot.send_message(100500, "Заказ принят")
+        assert message.message_id == 1
+
+    asyncio.run(run_with_bot(api, scenario, max_retries=0, method_timeouts={"getMe": 0.1}))
+
+
+def test_backoff_is_jittered_and_capped():
+    session = TunedAiohttpSession(backoff_base=0.5, backoff_max=10)
+    random.seed(1)
+    for attempt in range(8):
+        delays = [session.backoff(attempt) for _ in range(200)]
+        limit = min(10, 0.5 * 2 ** attempt)
+        assert all(0 <= delay <= limit for delay in delays)
+        # Full jitter: задержки разбросаны по всему интервалу, а не одинаковые
+        assert max(delays) - min(delays) > limit / 2
@@ -0,0 +1,86 @@
+# Профиль выполнения (utils/runtime.py): uvloop и orjson необязательные,
+# без них профиль fast должен работать на стандартных asyncio и json
+import asyncio
+import importlib
+import json
+import sys
+import types
+
+import pytest
+
+import utils.runtime as runtime
+from utils.benchmark import bench, sample_updates
+
+
+class FakeUvloop(types.ModuleType):
+    # Подменяет uvloop, если он не установлен: считает созданные циклы
+    def __init__(self):
+        super().__init__("uvloop")
+        self.loops = 0
+
+    def new_event_loop(self):
+        self.loops += 1
+        return asyncio.new_event_loop()
+
+
+@pytest.fixture
+def load_runtime(monkeypatch):
+    # Перезагружает utils.runtime с заданным RUNTIME_PROFILE и подмененными модулями
+    # (None в sys.modules - модуль "не установлен": import кидает ImportError)
+    def load(profile: str, **modules):
+        monkeypatch.setenv("RUNTIME_PROFILE", profile)
+        for name, module in modules.items():
+            monkeypatch.setitem(sys.modules, name, module)
+        return importlib.reload(runtime)
+
+    yield load
+    monkeypatch.undo()
+    importlib.reload(runtime)
+
+
+def test_fast_profile_with_optional_packages(load_runtime):
+    orjson = pytest.importorskip("orjson")
+    uvloop = FakeUvloop()
+    module = load_runtime("fast", orjson=orjson, uvloop=uvloop)
+
+    assert module.RUNTIME_PROFILE == "fast"
+    assert module.describe(module.RUNTIME_PROFILE) == "профиль fast: цикл uvloop, json orjson"
+    loads, dumps = module.json_backend()
+    assert loads is orjson.loads
+    assert dumps({"text": "пицца"}) == '{"text":"пицца"}'
+    assert module.loop_factory() == uvloop.new_event_loop
+
+    async def main():
+        return "ok"
+
+    assert module.run(main) == "ok"
+    assert uvloop.loops == 1
+
+
+def test_fast_profile_without_optional_packages(load_runtime):
+    module = load_runtime("fast", orjson=None, uvloop=None)
+
+    assert module.orjson is None and module.uvloop is None
+    assert module.describe(module.RUNTIME_PROFILE) == "профиль fast: цикл asyncio, json json"
+    assert module.json_backend() == (json.loads, json.dumps)
+    assert module.loop_factory() is None
+
+    async def main():
+        return "ok"
+
+    assert module.run(main) == "ok"
+
+
+def test_default_profile_ignores_optional_packages(load_runtime):
+    module = load_runtime("default", orjson=pytest.importorskip("orjson"), uvloop=FakeUvloop())
+
+    assert module.describe(module.RUNTIME_PROFILE) == "профиль default: цикл asyncio, json json"
+    assert module.json_backend() == (json.loads, json.dumps)
+    assert module.loop_factory() is None
+
+
+@pytest.mark.parametrize("profile", ["default", "fast"])
+def test_benchmark_runs(profile):
+    raw_updates = sample_updates() * 40
+    updates_per_second = runtime.run(lambda: bench(raw_updates, profile), profile)
+    assert updates_per_second > 0
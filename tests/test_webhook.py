@@ -0,0 +1,115 @@
+# Webhook сервер (utils/webhook.py): записанный апдейт отправляется POST запросом
+# на локальный aiohttp сервер, как это делает Telegram
+import asyncio
+import json
+from pathlib import Path
+
+from aiogram import Bot, Dispatcher, Router, types
+from aiohttp.test_utils import TestClient, TestServer
+
+from utils.webhook import create_webhook_app
+
+
+UPDATE = json.loads((Path(__file__).parent / "fixtures" / "update_message.json").read_text(encoding="utf-8"))
+SECRET = "test-secret"
+HEADERS = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+
+
+class Handled:
+    # Что увидел хендлер: тексты сообщений и сколько апдейтов обрабатывалось одновременно
+    def __init__(self):
+        self.texts = []
+        self.active = 0
+        self.max_active = 0
+        self.release = asyncio.Event()
+
+
+def make_client(handled: Handled, max_concurrency: int = 100) -> TestClient:
+    router = Router()
+
+    @router.message()
+    async def on_message(message: types.Message):
+        handled.active += 1
+        handled.max_active = max(handled.max_active, handled.active)
+        try:
+            await handled.release.wait()
+            handled.texts.append(message.text)
+        finally:
+            handled.active -= 1
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot("123456:test-token")
+    app = create_webhook_app(dp, bot, path="/webhook", secret_token=SECRET, max_concurrency=max_concurrency)
+    return TestClient(TestServer(app))
+
+
+def update(update_id: int) -> dict:
+    return {**UPDATE, "update_id": update_id}
+
+
+async def wait_for(condition, timeout: float = 1) -> None:
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+def test_secret_token_is_required():
+    async def scenario():
+        handled = Handled()
+        handled.release.set()
+        async with make_client(handled) as client:
+            response = await client.post("/webhook", json=update(1))
+            assert response.status == 401
+            response = await client.post("/webhook", json=update(2), headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+            assert response.status == 401
+
+            response = await client.post("/webhook", json=update(3), headers=HEADERS)
+            assert response.status == 200
+            await wait_for(lambda: handled.texts)
+        assert handled.texts == [UPDATE["message"]["text"]]
+
+    asyncio.run(scenario())
+
+
+def test_concurrency_is_capped():
+    async def scenario():
+        handled = Handled()
+        async with make_client(handled, max_concurrency=2) as client:
+            first = await client.post("/webhook", json=update(1), headers=HEADERS)
+            second = await client.post("/webhook", json=update(2), headers=HEADERS)
+            assert first.status == second.status == 200
+            await wait_for(lambda: handled.active == 2)
+
+            # Оба слота заняты: ответ на третий апдейт задерживается
+            third = asyncio.create_task(client.post("/webhook", json=update(3), headers=HEADERS))
+            await asyncio.sleep(0.2)
+            assert not third.done()
+
+            handled.release.set()
+            assert (await third).status == 200
+            await wait_for(lambda: len(handled.texts) == 3)
+        assert handled.max_active == 2
+
+    asyncio.run(scenario())
+
+
+def test_shutdown_drains_accepted_updates():
+    async def scenario():
+        handled = Handled()
+        client = make_client(handled)
+        await client.start_server()
+        response = await client.post("/webhook", json=update(1), headers=HEADERS)
+        assert response.status == 200
+        await wait_for(lambda: handled.active == 1)
+
+        # Остановка сервера ждет апдейт, который уже получил 200
+        closing = asyncio.create_task(client.close())
+        await asyncio.sleep(0.2)
+        assert not closing.done()
+
+        handled.release.set()
+        await closing
+        assert handled.texts == [UPDATE["message"]["text"]]
+
+    asyncio.run(scenario())
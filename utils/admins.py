@@ -0,0 +1,98 @@
+# Реестр администраторов: кто из пользователей админ хотя бы в одной группе с ботом.
+# Хранится в БД (таблица chat_admin), поэтому переживает перезапуск и общий для
+# всех процессов бота, а в памяти лежит множеством - проверка IsAdmin за O(1).
+# Фоновая задача раз в refresh_interval секунд перечитывает админов через getChatAdministrators
+import asyncio
+import logging
+import os
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from database.orm_query import (
+    on_commit,
+    orm_commit,
+    orm_delete_chat_admins,
+    orm_get_chat_admins,
+    orm_set_chat_admins,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class AdminRegistry:
+    def __init__(self, refresh_interval: float = 3600):
+        self.refresh_interval = refresh_interval
+        self.chats: dict[int, frozenset[int]] = {}
+        self.admins: frozenset[int] = frozenset()
+        self._task: asyncio.Task | None = None
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.admins
+
+    def _set_chat(self, chat_id: int, user_ids) -> None:
+        chats = dict(self.chats)
+        if user_ids:
+            chats[chat_id] = frozenset(user_ids)
+        else:
+            chats.pop(chat_id, None)
+        self._swap(chats)
+
+    def _swap(self, chats: dict[int, frozenset[int]]) -> None:
+        self.chats = chats
+        self.admins = frozenset().union(*chats.values())
+
+    async def load(self, session) -> None:
+        chats: dict[int, set[int]] = {}
+        for chat_id, user_id in await orm_get_chat_admins(session):
+            chats.setdefault(chat_id, set()).add(user_id)
+        self._swap({chat_id: frozenset(users) for chat_id, users in chats.items()})
+
+    async def refresh_chat(self, bot: Bot, session, chat_id: int) -> frozenset[int]:
+        # Память обновляется только после коммита, вместе с таблицей
+        try:
+            members = await bot.get_chat_administrators(chat_id)
+        except (TelegramBadRequest, TelegramForbiddenError):
+            # Бота удалили из группы или группа стала супергруппой с новым id
+            user_ids = frozenset()
+            await orm_delete_chat_admins(session, chat_id)
+        else:
+            user_ids = frozenset(
+                member.user.id
+                for member in members
+                if member.status == "creator" or member.status == "administrator"
+            )
+            await orm_set_chat_admins(session, chat_id, user_ids)
+        on_commit(session, lambda: self._set_chat(chat_id, user_ids))
+        return user_ids
+
+    async def start(self, bot: Bot, session_pool) -> None:
+        async with session_pool() as session:
+            await self.load(session)
+        self._task = asyncio.create_task(self._run(bot, session_pool))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, bot: Bot, session_pool) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                async with session_pool() as session:
+                    # Сначала подхватываем группы, добавленные другими процессами
+                    await self.load(session)
+                    for chat_id in list(self.chats):
+                        await self.refresh_chat(bot, session, chat_id)
+                    await orm_commit(session)
+            except Exception:
+                logger.exception("Не удалось обновить список администраторов")
+
+
+admin_registry = AdminRegistry(refresh_interval=float(os.getenv('ADMINS_REFRESH_INTERVAL', 3600)))
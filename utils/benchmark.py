@@ -0,0 +1,114 @@
+# Замер пропускной способности разбора апдейтов в профилях default и fast (utils/runtime.py).
+# Апдейты берутся из JSONL файла (по одному сырому апдейту Telegram в строке, например
+# сохраненные из логов webhook), без файла используется встроенный набор типичных апдейтов.
+# Запуск из корня проекта:
+#   python -m utils.benchmark [updates.jsonl] [--repeat 20]
+# Сеть и БД не задействованы: апдейт разбирается, проходит через диспетчер,
+# а хендлер собирает ответ с inline клавиатурой в форму запроса к Bot API
+import argparse
+import asyncio
+import json
+import time
+
+from aiogram import Bot, Dispatcher, F, Router, types
+from aiogram.methods import EditMessageMedia, SendPhoto
+
+from kbds.inline import MenuCallBack, get_user_main_btns
+from utils.bot_session import TunedAiohttpSession
+from utils.runtime import describe, json_backend, run
+
+
+def sample_updates() -> list[str]:
+    user = {"id": 100500, "is_bot": False, "first_name": "Иван", "language_code": "ru"}
+    private = {"id": 100500, "type": "private", "first_name": "Иван"}
+    group = {"id": -1001234, "type": "supergroup", "title": "Пиццерия"}
+    photo_message = {
+        "message_id": 42, "date": 1700000000, "chat": private,
+        "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+        "photo": [{"file_id": "AgAC" + "x" * 60, "file_unique_id": "u1", "width": 1280, "height": 720}],
+        "caption": "Главная страница",
+    }
+    updates = [
+        {"update_id": 1, "message": {"message_id": 1, "date": 1700000000, "chat": private, "from": user,
+                                     "text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}},
+        {"update_id": 3, "message": {"message_id": 3, "date": 1700000000, "chat": group, "from": user,
+                                     "text": "Когда будет пицца с ананасами?"}},
+    ]
+    callbacks = (
+        MenuCallBack(level=1, menu_name="catalog"),
+        MenuCallBack(level=2, menu_name="catalog", category=1, page=3),
+        MenuCallBack(level=3, menu_name="cart", cursor="n5"),
+    )
+    for i, callback_data in enumerate(callbacks):
+        updates.append({"update_id": 10 + i, "callback_query": {
+            "id": str(9000 + i), "from": user, "chat_instance": "1",
+            "data": callback_data.pack(), "message": photo_message,
+        }})
+    return [json.dumps(update, ensure_ascii=False) for update in updates]
+
+
+def build_dispatcher(session: TunedAiohttpSession) -> Dispatcher:
+    router = Router()
+
+    @router.message(F.text)
+    async def on_message(message: types.Message, bot: Bot):
+        method = SendPhoto(chat_id=message.chat.id, photo="AgAC", caption=message.text,
+                           reply_markup=get_user_main_btns(level=0))
+        session.build_form_data(bot, method)
+
+    @router.callback_query(MenuCallBack.filter())
+    async def on_callback(callback: types.CallbackQuery, callback_data: MenuCallBack, bot: Bot):
+        method = EditMessageMedia(
+            chat_id=callback.message.chat.id, message_id=callback.message.message_id,
+            media=types.InputMediaPhoto(media="AgAC", caption=callback_data.menu_name),
+            reply_markup=get_user_main_btns(level=callback_data.level),
+        )
+        session.build_form_data(bot, method)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+async def bench(raw_updates: list[str], profile: str) -> float:
+    json_loads, json_dumps = json_backend(profile)
+    session = TunedAiohttpSession(json_loads=json_loads, json_dumps=json_dumps)
+    bot = Bot("123456:benchmark", session=session)
+    dp = build_dispatcher(session)
+
+    async def feed(raw: str):
+        update = types.Update.model_validate(json_loads(raw), context={"bot": bot})
+        await dp.feed_update(bot, update)
+
+    # Прогрев, затем замер: апдейты подаются пачками, как при webhook
+    await asyncio.gather(*(feed(raw) for raw in raw_updates[:100]))
+    started = time.perf_counter()
+    for start in range(0, len(raw_updates), 100):
+        await asyncio.gather(*(feed(raw) for raw in raw_updates[start:start + 100]))
+    elapsed = time.perf_counter() - started
+    await session.close()
+    return len(raw_updates) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("updates", nargs="?", help="JSONL файл с записанными апдейтами")
+    parser.add_argument("--repeat", type=int, default=20, help="сколько раз прогнать набор")
+    args = parser.parse_args()
+
+    if args.updates:
+        with open(args.updates, encoding="utf-8") as f:
+            raw_updates = [line.strip() for line in f if line.strip()]
+    else:
+        raw_updates = sample_updates() * 200
+    raw_updates = raw_updates * args.repeat
+
+    results = {}
+    for profile in ("default", "fast"):
+        results[profile] = run(lambda: bench(raw_updates, profile), profile)
+        print(f"{describe(profile)}: {results[profile]:.0f} апдейтов/с")
+    print(f"ускорение: x{results['fast'] / results['default']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
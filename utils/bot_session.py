@@ -0,0 +1,138 @@
+# HTTP сессия бота к Bot API с настраиваемым пулом соединений,
+# таймаутами по методам и повторами для идемпотентных запросов
+import asyncio
+import logging
+import random
+
+from aiohttp import ClientSession, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+
+from aiogram.__meta__ import __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.exceptions import ClientDecodeError, TelegramNetworkError, TelegramServerError
+
+
+logger = logging.getLogger(__name__)
+
+
+# Повторять можно только запросы, повтор которых не создаст дубль:
+# чтение, правки, удаление и настройки бота. sendMessage и т.п. не повторяем
+IDEMPOTENT_METHODS = ('get', 'edit', 'delete', 'set', 'answerCallbackQuery')
+
+
+class SessionStats:
+    # Счетчики для оценки, насколько хорошо переиспользуются соединения
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    @property
+    def reuse_ratio(self) -> float:
+        total = self.connections_created + self.connections_reused
+        return self.connections_reused / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'errors': self.errors,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'reuse_ratio': round(self.reuse_ratio, 3),
+        }
+
+
+class TunedAiohttpSession(AiohttpSession):
+    def __init__(
+        self,
+        *,
+        api: TelegramAPIServer = PRODUCTION,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        ttl_dns_cache: int = 3600,
+        keepalive_timeout: float = 60,
+        timeout: float = 30,
+        method_timeouts: dict[str, float] | None = None,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10,
+        **kwargs,
+    ):
+        super().__init__(api=api, limit=limit, timeout=timeout, **kwargs)
+        self._connector_init.update(
+            limit_per_host=limit_per_host,
+            ttl_dns_cache=ttl_dns_cache,
+            keepalive_timeout=keepalive_timeout,
+        )
+        self.method_timeouts = method_timeouts or {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = SessionStats()
+
+    def _trace_config(self) -> TraceConfig:
+        trace_config = TraceConfig()
+
+        async def on_connection_create_end(session, context, params):
+            self.stats.connections_created += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.stats.connections_reused += 1
+
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    async def create_session(self) -> ClientSession:
+        # То же, что в AiohttpSession, но с трассировкой соединений
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}"},
+                trace_configs=[self._trace_config()],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    def check_response(self, bot, method, status_code, content):
+        # Прокси и балансировщики на 502/504 отдают HTML страницу, а не JSON Bot API.
+        # Такой ответ - тоже ошибка сервера, и его можно повторить
+        try:
+            return super().check_response(bot=bot, method=method, status_code=status_code, content=content)
+        except ClientDecodeError:
+            if status_code >= 500:
+                raise TelegramServerError(method=method, message=f"HTTP {status_code}: {content[:200]}")
+            raise
+
+    def backoff(self, attempt: int) -> float:
+        # Экспоненциальная задержка со случайным разбросом (full jitter),
+        # чтобы повторы разных запросов не били в API одновременно
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def make_request(self, bot, method, timeout=None):
+        api_method = method.__api_method__
+        if timeout is None:
+            timeout = self.method_timeouts.get(api_method)
+        retries = self.max_retries if api_method.startswith(IDEMPOTENT_METHODS) else 0
+
+        for attempt in range(retries + 1):
+            self.stats.requests += 1
+            try:
+                return await super().make_request(bot, method, timeout=timeout)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if attempt == retries:
+                    self.stats.errors += 1
+                    raise
+                self.stats.retries += 1
+                delay = self.backoff(attempt)
+                logger.warning("%s: %s, повтор через %.2f с", api_method, e, delay)
+                await asyncio.sleep(delay)
@@ -0,0 +1,123 @@
+# Поиск запрещенных слов в сообщениях групп.
+# Список слов хранится в БД (таблица restricted_word) и собирается один раз
+# в неизменяемый матчер: множество целых слов + префиксное дерево основ.
+# Проверка сообщения - один проход по тексту, сколько бы слов ни было в списке
+import asyncio
+import logging
+import os
+import re
+from string import punctuation
+
+from common.restricted_words import restricted_words
+from database.orm_query import orm_get_restricted_words, orm_get_restricted_words_version
+
+
+logger = logging.getLogger(__name__)
+
+
+# Латиница и цифры, похожие на русские буквы: "kaбaн", "x0мяк" -> "кабан", "хомяк"
+LOOKALIKES = {
+    'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'k': 'к', 'm': 'м', 'o': 'о',
+    'p': 'р', 't': 'т', 'x': 'х', 'y': 'у', 'ё': 'е',
+    '0': 'о', '3': 'з', '4': 'ч', '6': 'б', '@': 'а', '$': 'с',
+}
+# Знаки препинания и невидимые символы выкидываем: "к.а.б.а.н" -> "кабан"
+INVISIBLE = '­​‌‍⁠﻿'
+
+TRANSLATE_TABLE = str.maketrans({
+    **{char: None for char in punctuation + INVISIBLE},
+    **LOOKALIKES,
+})
+REPEATS = re.compile(r'(.)\1+')
+
+STEM_END = ''
+
+
+def normalize(text: str) -> str:
+    # Повторы букв схлопываются: "кааабаан" -> "кабан".
+    # Слова из списка нормализуются так же, поэтому "ванна" в списке тоже сработает
+    return REPEATS.sub(r'\1', text.lower().translate(TRANSLATE_TABLE))
+
+
+class WordMatcher:
+    def __init__(self, words):
+        self.words = set()
+        self.stems = {}
+        for word in words:
+            if word.endswith('*'):
+                node = self.stems
+                for char in normalize(word[:-1]):
+                    node = node.setdefault(char, {})
+                node[STEM_END] = True
+            elif normalize(word):
+                self.words.add(normalize(word))
+
+    def find(self, text: str) -> str | None:
+        for word in normalize(text).split():
+            if word in self.words:
+                return word
+            node = self.stems
+            for char in word:
+                node = node.get(char)
+                if node is None:
+                    break
+                if STEM_END in node:
+                    return word
+        return None
+
+
+class WordFilter:
+    # Матчер перечитывается из БД раз в reload_interval секунд, если список изменился.
+    # Новый матчер подменяет старый одним присваиванием, хендлеры не ждут загрузки
+    def __init__(self, words=(), reload_interval: float = 300):
+        self.matcher = WordMatcher(words)
+        self.reload_interval = reload_interval
+        self.session_pool = None
+        self._version = None
+        self._task: asyncio.Task | None = None
+
+    def find(self, text: str) -> str | None:
+        return self.matcher.find(text)
+
+    async def reload(self, session_pool) -> None:
+        async with session_pool() as session:
+            version = await orm_get_restricted_words_version(session)
+            if version == self._version:
+                return
+            words = await orm_get_restricted_words(session)
+        self.matcher = WordMatcher(words)
+        self._version = version
+
+    async def start(self, session_pool) -> None:
+        self.session_pool = session_pool
+        await self.reload(session_pool)
+        self._task = asyncio.create_task(self._run(session_pool))
+
+    async def reload_now(self) -> None:
+        # После правки списка из админки, не дожидаясь reload_interval
+        if self.session_pool is not None:
+            await self.reload(self.session_pool)
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, session_pool) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload(session_pool)
+            except Exception:
+                logger.exception("Не удалось обновить список запрещенных слов")
+
+
+# До первой загрузки из БД работаем по встроенному списку
+word_filter = WordFilter(
+    restricted_words,
+    reload_interval=float(os.getenv('RESTRICTED_WORDS_RELOAD', 300)),
+)
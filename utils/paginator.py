@@ -2,18 +2,39 @@
 import math
 
 
-class Paginator:
-    def __init__(self, array: list | tuple, page: int=1, per_page: int=1):
-        self.array = array
-        self.per_page = per_page
+class Page:
+    # Одна страница, уже выбранная из БД (LIMIT/OFFSET), и общее число записей
+    def __init__(self, items: list | tuple, total: int, page: int=1, per_page: int=1):
+        self.items = items
+        self.total = total
         self.page = page
-        self.len = len(self.array)
+        self.per_page = per_page
+
+
+class Paginator:
+    def __init__(self, array: list | tuple | Page, page: int=1, per_page: int=1):
+        if isinstance(array, Page):
+            # В памяти лежит только запрошенная страница, а длина берется из total
+            self.array = array.items
+            self.per_page = array.per_page
+            self.page = array.page
+            self.len = array.total
+            self.offset = (array.page - 1) * array.per_page
+        else:
+            self.array = array
+            self.per_page = per_page
+            self.page = page
+            self.len = len(self.array)
+            self.offset = 0
         # math.ceil - округление в большую сторону до целого числа
         self.pages = math.ceil(self.len / self.per_page)
 
     def __get_slice(self):
-        start = (self.page - 1) * self.per_page
+        start = (self.page - 1) * self.per_page - self.offset
         stop = start + self.per_page
+        if start < 0:
+            # Для Page такой страницы нет в памяти, ее нужно выбрать из БД заново
+            return self.array[0:0]
         return self.array[start:stop]
 
     def get_page(self):
@@ -42,3 +63,87 @@ class Paginator:
             return self.__get_slice()
         raise IndexError(f'Previous page does not exist. Use has_previous() to check before.')
 
+
+
+# Пагинатор по курсору (keyset): вместо номера страницы помним ключ крайней записи.
+# Курсор - строка вида "n<ключ>" (записи после ключа) или "p<ключ>" (записи до ключа),
+# поэтому его можно положить в callback data. Удаление или добавление строк не сдвигает
+# страницы, а каждая выборка стоит O(per_page) - без OFFSET и без COUNT.
+class KeysetPaginator:
+    def __init__(
+        self,
+        session,
+        query,
+        key,
+        cursor: str | None = None,
+        per_page: int = 1,
+        scalars: bool = True,
+        get_key=None,
+    ):
+        self.session = session
+        self.query = query
+        self.key = key
+        self.cursor = cursor
+        self.per_page = per_page
+        self.scalars = scalars
+        self.get_key = get_key or (lambda item: getattr(item, key.key))
+        self.items = []
+        self.__next = False
+        self.__previous = False
+
+    @staticmethod
+    def parse_cursor(cursor: str | None):
+        # Курсор приходит из callback data, ее можно подделать:
+        # на непонятный курсор показываем первую страницу
+        if not cursor or cursor[0] not in ("n", "p"):
+            return None, None
+        try:
+            return cursor[0], int(cursor[1:])
+        except ValueError:
+            return None, None
+
+    async def __fetch(self, condition, order):
+        # Берем на одну строку больше, чтобы узнать, есть ли что-то дальше
+        query = self.query.order_by(order).limit(self.per_page + 1)
+        if condition is not None:
+            query = query.where(condition)
+        result = await self.session.execute(query)
+        rows = result.scalars().all() if self.scalars else result.all()
+        rows = list(rows)
+        has_more = len(rows) > self.per_page
+        return rows[:self.per_page], has_more
+
+    async def __forward(self, condition, has_previous):
+        self.items, self.__next = await self.__fetch(condition, self.key.asc())
+        self.__previous = has_previous
+
+    async def __backward(self, condition):
+        items, self.__previous = await self.__fetch(condition, self.key.desc())
+        self.items = items[::-1]
+        self.__next = True
+
+    async def get_page(self):
+        direction, value = self.parse_cursor(self.cursor)
+        if direction == "p":
+            await self.__backward(self.key < value)
+            if not self.items:
+                await self.__forward(None, False)
+        elif direction == "n":
+            await self.__forward(self.key > value, True)
+            if not self.items:
+                # Дальше записей нет (например, удалили последнюю) - показываем хвост
+                await self.__backward(self.key <= value)
+                self.__next = False
+        else:
+            await self.__forward(None, False)
+        return self.items
+
+    def has_next(self):
+        if self.__next and self.items:
+            return f"n{self.get_key(self.items[-1])}"
+        return False
+
+    def has_previous(self):
+        if self.__previous and self.items:
+            return f"p{self.get_key(self.items[0])}"
+        return False
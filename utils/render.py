@@ -0,0 +1,80 @@
+# Перерисовка inline меню самым дешевым вызовом Bot API.
+# Для каждого сообщения меню запоминается отпечаток последней отрисовки:
+# картинка, хэш подписи и хэш клавиатуры. По нему выбирается, что реально нужно
+# менять: ничего, только клавиатуру, подпись (вместе с клавиатурой) или всю картинку.
+# Отпечатки живут в памяти процесса. Если бот запущен в несколько процессов
+# (webhook за балансировщиком), сообщение мог перерисовать другой процесс, поэтому
+# своему отпечатку верим только trust секунд (MENU_RENDER_TRUST), а дальше
+# перерисовываем целиком. По умолчанию бот работает в одном процессе и отпечаток
+# живет сутки; для нескольких процессов ставьте MENU_RENDER_TRUST=0 (или несколько секунд)
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+
+
+class RenderFingerprint(NamedTuple):
+    media: str
+    caption: int
+    markup: int
+
+
+def fingerprint(media: types.InputMediaPhoto, reply_markup) -> RenderFingerprint:
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else ''
+    return RenderFingerprint(media.media, hash(media.caption), hash(markup))
+
+
+class MenuRenders:
+    # Ограниченный LRU: (chat_id, message_id) -> (отпечаток последней отрисовки, когда записан)
+    def __init__(self, maxsize: int = 10000, trust: float = 86400):
+        self.maxsize = maxsize
+        self.trust = trust
+        self._renders: OrderedDict[tuple[int, int], tuple[RenderFingerprint, float]] = OrderedDict()
+
+    def get(self, message: types.Message) -> RenderFingerprint | None:
+        key = (message.chat.id, message.message_id)
+        render = self._renders.get(key)
+        if render is None:
+            return None
+        render, written_at = render
+        if time.monotonic() - written_at >= self.trust:
+            # Старый отпечаток мог устареть из-за правки другим процессом
+            del self._renders[key]
+            return None
+        self._renders.move_to_end(key)
+        return render
+
+    def remember(self, message: types.Message, media: types.InputMediaPhoto, reply_markup) -> None:
+        key = (message.chat.id, message.message_id)
+        self._renders[key] = (fingerprint(media, reply_markup), time.monotonic())
+        self._renders.move_to_end(key)
+        if len(self._renders) > self.maxsize:
+            self._renders.popitem(last=False)
+
+
+menu_renders = MenuRenders(
+    maxsize=int(os.getenv('MENU_RENDER_CACHE_SIZE', 10000)),
+    trust=float(os.getenv('MENU_RENDER_TRUST', 86400)),
+)
+
+
+async def edit_menu(message: types.Message, media: types.InputMediaPhoto, reply_markup) -> None:
+    old = menu_renders.get(message)
+    new = fingerprint(media, reply_markup)
+
+    try:
+        if old is None or old.media != new.media:
+            # Неизвестное или давно отрисованное сообщение перерисовываем целиком
+            await message.edit_media(media=media, reply_markup=reply_markup)
+        elif old.caption != new.caption:
+            await message.edit_caption(caption=media.caption, reply_markup=reply_markup)
+        elif old.markup != new.markup:
+            await message.edit_reply_markup(reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+
+    menu_renders.remember(message, media, reply_markup)
@@ -0,0 +1,50 @@
+# Профиль выполнения бота. RUNTIME_PROFILE=fast включает uvloop вместо стандартного
+# цикла событий и orjson для разбора апдейтов и сборки запросов к Bot API.
+# Обе библиотеки необязательные (pip install uvloop orjson): если какой-то нет,
+# используется стандартная замена и бот работает как обычно
+import asyncio
+import json
+import os
+
+
+RUNTIME_PROFILE = os.getenv('RUNTIME_PROFILE', 'default')
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+def orjson_dumps(value) -> str:
+    # aiogram ждет str, а orjson возвращает bytes
+    return orjson.dumps(value).decode()
+
+
+def json_backend(profile: str = RUNTIME_PROFILE):
+    # Возвращает (json_loads, json_dumps) для сессии бота
+    if profile == 'fast' and orjson is not None:
+        return orjson.loads, orjson_dumps
+    return json.loads, json.dumps
+
+
+def loop_factory(profile: str = RUNTIME_PROFILE):
+    if profile == 'fast' and uvloop is not None:
+        return uvloop.new_event_loop
+    return None
+
+
+def run(main, profile: str = RUNTIME_PROFILE):
+    # Замена asyncio.run(main()) с учетом профиля
+    with asyncio.Runner(loop_factory=loop_factory(profile)) as runner:
+        return runner.run(main())
+
+
+def describe(profile: str = RUNTIME_PROFILE) -> str:
+    loads, _ = json_backend(profile)
+    loop = 'uvloop' if loop_factory(profile) else 'asyncio'
+    return f"профиль {profile}: цикл {loop}, json {'orjson' if loads is not json.loads else 'json'}"
@@ -0,0 +1,133 @@
+# Планировщик отложенных задач, которые хранятся в БД (таблица scheduled_job).
+# Один фоновый цикл спит до ближайшей задачи и выполняет созревшие пачками,
+# поэтому хендлеры не ждут в asyncio.sleep, а задачи переживают перезапуск бота
+import asyncio
+import logging
+from datetime import timedelta
+
+from database.orm_query import orm_add_job, orm_commit, orm_get_next_job_time, orm_take_due_jobs, on_commit, utcnow
+from middlewares.outbound import PRIORITY_BULK, outbound_priority
+
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    def __init__(
+        self,
+        batch_size: int = 100,
+        poll_interval: float = 60,
+        max_attempts: int = 5,
+        retry_delay: float = 30,
+        max_retry_delay: float = 3600,
+    ):
+        self.batch_size = batch_size
+        # Упавшая задача возвращается в очередь через retry_delay * 2^попытка секунд
+        # (но не больше max_retry_delay), после max_attempts попыток она удаляется
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        # Даже без новых задач раз в poll_interval заглядываем в БД:
+        # задачи мог добавить другой процесс бота
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        self.session_pool = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def handler(self, kind: str):
+        # Регистрирует обработчик задач вида kind: async def f(bot, session, job)
+        def decorator(func):
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    async def schedule(self, session, kind: str, delay: float, **fields):
+        # Задача сохраняется в той же транзакции, что и остальная работа хендлера
+        await orm_add_job(session, kind, utcnow() + timedelta(seconds=delay), **fields)
+        on_commit(session, self._wakeup.set)
+
+    async def start(self, bot, session_pool):
+        self.session_pool = session_pool
+        self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_batch(self, bot) -> bool:
+        # Пачку забираем и сразу коммитим: пока задачи выполняются (с запросами к Telegram,
+        # ожиданием лимитов и повторами), транзакция на запись не держится открытой
+        async with self.session_pool() as session:
+            jobs = await orm_take_due_jobs(session, utcnow(), self.batch_size)
+            await orm_commit(session)
+
+        for job in jobs:
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                logger.warning("Нет обработчика для задачи %s", job.kind)
+                continue
+            try:
+                # Каждая задача - в своей короткой сессии: ошибка откатывает только ее изменения
+                async with self.session_pool() as session:
+                    await handler(bot, session, job)
+                    await orm_commit(session)
+            except Exception:
+                logger.exception("Задача %s (%s) завершилась ошибкой", job.id, job.kind)
+                await self._retry(job)
+        return len(jobs) == self.batch_size
+
+    async def _retry(self, job) -> None:
+        attempts = job.attempts + 1
+        if attempts >= self.max_attempts:
+            logger.error("Задача %s удалена после %s попыток", job.kind, attempts)
+            return
+        delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+        try:
+            async with self.session_pool() as session:
+                await orm_add_job(
+                    session,
+                    job.kind,
+                    run_at=utcnow() + timedelta(seconds=delay),
+                    chat_id=job.chat_id,
+                    message_id=job.message_id,
+                    user_id=job.user_id,
+                    attempts=attempts,
+                )
+                await orm_commit(session)
+        except Exception:
+            logger.exception("Не удалось вернуть задачу %s (%s) в очередь", job.id, job.kind)
+
+    async def _sleep_time(self) -> float:
+        async with self.session_pool() as session:
+            next_at = await orm_get_next_job_time(session)
+        if next_at is None:
+            return self.poll_interval
+        return min(max((next_at - utcnow()).total_seconds(), 0), self.poll_interval)
+
+    async def _run(self, bot):
+        # Сообщения задач пропускают вперед ответы пользователям
+        outbound_priority.set(PRIORITY_BULK)
+        while True:
+            self._wakeup.clear()
+            try:
+                # Пачка была полной - значит, созревшие задачи могли остаться
+                while await self._run_batch(bot):
+                    pass
+                timeout = await self._sleep_time()
+            except Exception:
+                logger.exception("Ошибка планировщика")
+                timeout = self.poll_interval
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+scheduler = Scheduler()
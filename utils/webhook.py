@@ -0,0 +1,88 @@
+# Режим webhook: aiohttp сервер принимает апдейты от Telegram (обычно за reverse proxy)
+import asyncio
+import logging
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    # Telegram сразу получает 200, а апдейт обрабатывается в фоне.
+    # Одновременно обрабатывается не больше max_concurrency апдейтов: когда все слоты заняты,
+    # ответ на следующий запрос задерживается, и Telegram сам притормаживает доставку
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: str,
+        max_concurrency: int = 100,
+        **data: Any,
+    ) -> None:
+        super().__init__(
+            dispatcher=dispatcher,
+            bot=bot,
+            handle_in_background=True,
+            secret_token=secret_token,
+            **data,
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _process_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            await self._background_feed_update(bot=bot, update=update)
+        except Exception:
+            logger.exception("Ошибка при обработке апдейта %s", update.get("update_id"))
+        finally:
+            self._semaphore.release()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._process_update(bot, update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        # Даем дообработать уже принятые апдейты
+        if self._background_feed_update_tasks:
+            await asyncio.gather(*self._background_feed_update_tasks, return_exceptions=True)
+        await super().close()
+
+
+def create_webhook_app(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    *,
+    path: str,
+    secret_token: str,
+    max_concurrency: int = 100,
+    **data: Any,
+) -> web.Application:
+    # Те же startup/shutdown хуки диспетчера, что и при polling, вызываются из aiohttp
+    app = web.Application()
+    BoundedRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        secret_token=secret_token,
+        max_concurrency=max_concurrency,
+        **data,
+    ).register(app, path=path)
+    setup_application(app, dispatcher, bot=bot, **data)
+    return app
+
+
+async def run_webhook(app: web.Application, host: str, port: int) -> None:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()